@@ -0,0 +1,35 @@
+import hashlib
+import json
+import os
+from typing import Iterable
+
+from app.cache import TieredCache, normalize_query
+
+# Final responses are cached by (document hash, normalized query, model, prompt
+# version). The prompt version is a hash of the prompt template text, so editing
+# a prompt makes old entries unreachable without any manual invalidation.
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_CACHE_MAX_BYTES = int(os.getenv("ANSWER_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+ANSWER_CACHE_DB = os.getenv("ANSWER_CACHE_DB")
+ANSWER_CACHE_DISK_MAX_BYTES = int(os.getenv("ANSWER_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+
+answer_cache = TieredCache(
+    "answers", ANSWER_CACHE_MAX_BYTES, ANSWER_CACHE_DB, ANSWER_CACHE_DISK_MAX_BYTES, ttl=ANSWER_CACHE_TTL
+)
+
+
+def prompt_version(*parts) -> str:
+    """Fingerprint of a prompt template plus any settings that change what goes into it."""
+    return hashlib.sha256(json.dumps([str(p) for p in parts]).encode()).hexdigest()[:16]
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def combined_hash(hashes: Iterable[str]) -> str:
+    return content_hash("\n".join(hashes))
+
+
+def answer_key(doc_hash: str, query: str, model: str, version: str) -> str:
+    return content_hash(json.dumps([doc_hash, normalize_query(query), model, version]))
@@ -0,0 +1,223 @@
+import asyncio
+import os
+from contextlib import nullcontext
+from typing import Awaitable, Callable, List, Optional, Tuple
+
+from app import gemini
+from app.answer_cache import prompt_version
+
+# Map-reduce over many papers: one "map" call per paper (or per page group for
+# papers too large for one call), then "reduce" calls that merge the notes,
+# hierarchically when they don't fit in one prompt.
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "50"))
+BATCH_MAP_CONCURRENCY = int(os.getenv("BATCH_MAP_CONCURRENCY", "4"))
+BATCH_MAP_CHAR_BUDGET = int(os.getenv("BATCH_MAP_CHAR_BUDGET", "60000"))
+BATCH_REDUCE_CHAR_BUDGET = int(os.getenv("BATCH_REDUCE_CHAR_BUDGET", "60000"))
+
+
+def map_prompt(query: str, title: str, text: str) -> str:
+    return f"""You are reviewing one paper as part of a literature review on the question: {query}
+
+Paper: {title}
+
+Paper content (each section tagged with its page number):
+{text}
+
+Write concise research notes on what this paper says that is relevant to the question:
+1. Its main claims and findings relevant to the question
+2. Methods, data, or evidence behind them
+3. Important quotes, citing the page number as (p. N)
+If the paper is not relevant to the question, say so in one sentence."""
+
+
+def combine_prompt(query: str, notes: str) -> str:
+    return f"""The following are research notes on the question: {query}
+Each block is labeled with the paper (and pages) it came from.
+
+{notes}
+
+Merge these notes into one set of notes. Keep every claim attributed to its paper label and keep page citations (p. N). Drop repetition but do not drop findings."""
+
+
+def reduce_prompt(query: str, notes: str) -> str:
+    return f"""You are writing a literature review answering the question: {query}
+
+Below are research notes for each paper, labeled with the paper they came from:
+
+{notes}
+
+Please provide:
+1. A comprehensive synthesized answer to the question across all papers
+2. Points where the papers agree, disagree, or complement each other
+3. Key findings, attributing each one to its paper label, e.g. [Paper 2] (p. N)
+4. Gaps or open questions the papers leave
+
+Format your response in a clear, structured way."""
+
+
+# Cached batch answers are invalidated automatically when any prompt or budget changes
+BATCH_PROMPT_VERSION = prompt_version(
+    map_prompt("{query}", "{title}", "{text}"),
+    combine_prompt("{query}", "{notes}"),
+    reduce_prompt("{query}", "{notes}"),
+    BATCH_MAP_CHAR_BUDGET,
+    BATCH_REDUCE_CHAR_BUDGET,
+)
+
+
+def format_notes(notes: List[Tuple[str, str]]) -> str:
+    return "\n\n".join(f"### {label}\n{text}" for label, text in notes)
+
+
+def page_groups(pages: List[str], budget: int) -> List[Tuple[int, int, str]]:
+    """Split pages into consecutive (first page, last page, text) groups of at most budget characters.
+
+    A page longer than the budget is split across several groups, each part
+    tagged with its page number, rather than cut off.
+    """
+    blocks = []
+    for number, text in enumerate(pages, start=1):
+        tag = f"[Page {number}]\n"
+        text = text.strip()
+        step = max(1, budget - len(tag))
+        for offset in range(0, max(len(text), 1), step):
+            blocks.append((number, tag + text[offset:offset + step]))
+
+    groups = []
+    first, last, parts, size = 1, 1, [], 0
+    for number, block in blocks:
+        if parts and size + len(block) > budget:
+            groups.append((first, last, "\n\n".join(parts)))
+            first, parts, size = number, [], 0
+        parts.append(block)
+        size += len(block) + 2
+        last = number
+    if parts:
+        groups.append((first, last, "\n\n".join(parts)))
+    return groups
+
+
+async def gather_or_cancel(*calls: Awaitable) -> list:
+    """Like asyncio.gather, but a failure cancels the other calls.
+
+    Otherwise they would keep running, and holding Gemini slots, for a result
+    nobody will use.
+    """
+    tasks = [asyncio.ensure_future(call) for call in calls]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+
+class MapReduce:
+    """Runs the LLM calls of one batch with at most BATCH_MAP_CONCURRENCY in flight.
+
+    Background runs (jobs) also pass a semaphore shared by all of them, and
+    wait for Gemini slots instead of being rejected when the queue is full.
+    """
+
+    def __init__(
+        self,
+        query: str,
+        concurrency: int = BATCH_MAP_CONCURRENCY,
+        on_chunk: Optional[Callable[[], None]] = None,
+        shared: Optional[asyncio.Semaphore] = None,
+    ):
+        self.query = query
+        # Called after each map call, i.e. once per page group summarized
+        self.on_chunk = on_chunk
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._shared = shared
+
+    async def _generate(self, prompt: str) -> str:
+        async with self._semaphore, self._shared or nullcontext():
+            return await gemini.generate(prompt, background=self._shared is not None)
+
+    async def _map(self, title: str, text: str) -> str:
+        note = await self._generate(map_prompt(self.query, title, text))
+        if self.on_chunk is not None:
+            self.on_chunk()
+        return note
+
+    async def summarize_document(self, title: str, pages: List[str]) -> str:
+        groups = page_groups(pages, BATCH_MAP_CHAR_BUDGET)
+        if len(groups) <= 1:
+            text = groups[0][2] if groups else ""
+            return await self._map(title, text)
+        # Too large for one call: take notes on each page range, then merge them.
+        section_notes = await gather_or_cancel(*(
+            self._map(f"{title} (pages {first}-{last})", text) for first, last, text in groups
+        ))
+        labeled = [(f"{title} (pages {first}-{last})", note) for (first, last, _), note in zip(groups, section_notes)]
+        return await self.combine(labeled)
+
+    async def combine(self, notes: List[Tuple[str, str]]) -> str:
+        """Merge labeled notes into one, in rounds, until a single note remains."""
+        while len(notes) > 1:
+            notes = await self._merge(self._fit(notes))
+        return notes[0][1] if notes else ""
+
+    async def reduce(self, notes: List[Tuple[str, str]]) -> str:
+        # Shrink the notes hierarchically until the final synthesis fits in one prompt.
+        while len(self._fit(notes)) > 1:
+            notes = await self._merge(self._fit(notes))
+        return await self._generate(reduce_prompt(self.query, format_notes(notes)))
+
+    async def _merge(self, batches: List[List[Tuple[str, str]]]) -> List[Tuple[str, str]]:
+        merged = await gather_or_cancel(*(
+            self._generate(combine_prompt(self.query, format_notes(batch))) for batch in batches
+        ))
+        return [(" + ".join(label for label, _ in batch), text) for batch, text in zip(batches, merged)]
+
+    def _fit(self, notes: List[Tuple[str, str]]) -> List[List[Tuple[str, str]]]:
+        # Greedily pack notes into batches of at most BATCH_REDUCE_CHAR_BUDGET characters.
+        # Every batch holds at least two notes when possible so each round makes progress.
+        batches: List[List[Tuple[str, str]]] = []
+        size = 0
+        for label, text in notes:
+            length = len(label) + len(text) + 8
+            if batches and (size + length <= BATCH_REDUCE_CHAR_BUDGET or len(batches[-1]) < 2):
+                batches[-1].append((label, text))
+                size += length
+            else:
+                batches.append([(label, text)])
+                size = length
+        return batches
+
+
+def chunk_count(pages: List[str]) -> int:
+    """Number of map calls summarize_document makes for a paper."""
+    return max(1, len(page_groups(pages, BATCH_MAP_CHAR_BUDGET)))
+
+
+async def research_papers(
+    query: str,
+    papers: List[Tuple[str, List[str]]],
+    concurrency: int = BATCH_MAP_CONCURRENCY,
+    on_chunk: Optional[Callable[[], None]] = None,
+    shared: Optional[asyncio.Semaphore] = None,
+) -> Tuple[str, List[dict]]:
+    """Answer one query across many papers, given as (title, pages) pairs.
+
+    Returns the synthesized summary, which cites papers as "Paper N" in the
+    order given, and one source per paper carrying its notes.
+    """
+    mapper = MapReduce(query, concurrency, on_chunk, shared)
+    # Labels leave out filenames: the answer is cached by content and served to uploads with other names
+    labels = [f"Paper {i}" for i in range(1, len(papers) + 1)]
+    notes = await gather_or_cancel(*(
+        mapper.summarize_document(label, pages) for label, (_, pages) in zip(labels, papers)
+    ))
+    summary = await mapper.reduce(list(zip(labels, notes)))
+    sources = [{
+        "title": title,
+        "href": "",
+        "body": note[:500] + ("..." if len(note) > 500 else ""),
+        "page_image": "",
+        "page_number": ""
+    } for (title, _), note in zip(papers, notes)]
+    return summary, sources
@@ -0,0 +1,215 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+
+def normalize_query(query: str) -> str:
+    """Canonical form of a user question for cache keys: case, spacing and trailing punctuation don't matter."""
+    return re.sub(r"\s+", " ", query).strip().lower().rstrip("?!.")
+
+
+class TieredCache:
+    """JSON-value cache with a byte-bounded in-process LRU tier and an optional SQLite tier.
+
+    Entries evicted from memory stay on disk (when a db_path is configured) and
+    are promoted back into memory on the next hit, so the disk tier survives
+    restarts and holds more than fits in RAM. With a ttl (seconds), entries
+    expire in both tiers that long after they were set. Code on the event loop
+    should use aget/aset, which run the SQLite tier on a worker thread.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_bytes: int,
+        db_path: Optional[str] = None,
+        max_disk_bytes: int = 0,
+        ttl: Optional[float] = None,
+    ):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[Any, int, float]]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "evictions": 0, "disk_evictions": 0}
+        self._db: Optional[sqlite3.Connection] = None
+        # Running totals of the disk tier, so stats() doesn't scan the table. Other processes may
+        # share the file, so they are re-read from SQLite before each eviction check
+        self._disk_entries = 0
+        self._disk_bytes = 0
+        if db_path:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "name TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "size INTEGER NOT NULL, accessed REAL NOT NULL, expires REAL, PRIMARY KEY (name, key))"
+            )
+            columns = {row[1] for row in self._db.execute("PRAGMA table_info(cache)")}
+            if "expires" not in columns:
+                self._db.execute("ALTER TABLE cache ADD COLUMN expires REAL")
+            self._db.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (name, accessed)")
+            # Covers the SUM(size) in _read_disk_totals
+            self._db.execute("CREATE INDEX IF NOT EXISTS cache_size ON cache (name, size)")
+            self._db.commit()
+            self._read_disk_totals()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            now = time.time()
+            expired = False
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[2] > now:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return entry[0]
+                self._memory_delete(key)
+                expired = True
+            raw, expires, disk_expired = self._disk_get(key, now)
+            if raw is None:
+                # Count a lookup that expired in memory and on disk once
+                if expired or disk_expired:
+                    self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._stats["disk_hits"] += 1
+        value = json.loads(raw)
+        with self._lock:
+            self._memory_set(key, value, len(raw), expires)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        raw = json.dumps(value)
+        expires = time.time() + self.ttl if self.ttl else float("inf")
+        with self._lock:
+            self._memory_set(key, value, len(raw), expires)
+            self._disk_set(key, raw, expires)
+
+    async def aget(self, key: str) -> Optional[Any]:
+        if self._db is None:
+            return self.get(key)
+        return await asyncio.get_running_loop().run_in_executor(None, self.get, key)
+
+    async def aset(self, key: str, value: Any) -> None:
+        if self._db is None:
+            self.set(key, value)
+        else:
+            await asyncio.get_running_loop().run_in_executor(None, self.set, key, value)
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["bytes"] = self._size
+            stats["max_bytes"] = self.max_bytes
+            if self._db is not None:
+                stats["disk_entries"] = self._disk_entries
+                stats["disk_bytes"] = self._disk_bytes
+            return stats
+
+    def _memory_delete(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= entry[1]
+
+    def _memory_set(self, key: str, value: Any, size: int, expires: float) -> None:
+        self._memory_delete(key)
+        if size > self.max_bytes:
+            return
+        self._entries[key] = (value, size, expires)
+        self._size += size
+        while self._size > self.max_bytes:
+            _, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self._size -= evicted_size
+            self._stats["evictions"] += 1
+
+    def _disk_get(self, key: str, now: float) -> Tuple[Optional[str], float, bool]:
+        """Return (raw value or None, expires, whether the disk entry had expired)."""
+        if self._db is None:
+            return None, 0.0, False
+        row = self._db.execute(
+            "SELECT value, expires, size FROM cache WHERE name = ? AND key = ?", (self.name, key)
+        ).fetchone()
+        if row is None:
+            return None, 0.0, False
+        expires = row[1] if row[1] is not None else float("inf")
+        if expires <= now:
+            self._disk_delete(key, row[2])
+            self._db.commit()
+            return None, expires, True
+        self._db.execute("UPDATE cache SET accessed = ? WHERE name = ? AND key = ?", (now, self.name, key))
+        self._db.commit()
+        return row[0], expires, False
+
+    def _read_disk_totals(self) -> None:
+        self._disk_entries, self._disk_bytes = self._db.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache WHERE name = ?", (self.name,)
+        ).fetchone()
+
+    def _disk_delete(self, key: str, size: int) -> None:
+        # Another process sharing the file may have deleted the row already
+        if self._db.execute("DELETE FROM cache WHERE name = ? AND key = ?", (self.name, key)).rowcount:
+            self._disk_entries -= 1
+            self._disk_bytes -= size
+
+    def _disk_set(self, key: str, raw: str, expires: float) -> None:
+        if self._db is None:
+            return
+        old = self._db.execute("SELECT size FROM cache WHERE name = ? AND key = ?", (self.name, key)).fetchone()
+        if old is not None:
+            self._disk_delete(key, old[0])
+        self._db.execute(
+            "INSERT INTO cache (name, key, value, size, accessed, expires) VALUES (?, ?, ?, ?, ?, ?)",
+            (self.name, key, raw, len(raw), time.time(), None if expires == float("inf") else expires),
+        )
+        self._disk_entries += 1
+        self._disk_bytes += len(raw)
+        if self.max_disk_bytes:
+            self._read_disk_totals()
+            while self._disk_bytes > self.max_disk_bytes:
+                row = self._db.execute(
+                    "SELECT key, size FROM cache WHERE name = ? ORDER BY accessed LIMIT 1", (self.name,)
+                ).fetchone()
+                if row is None:
+                    break
+                self._disk_delete(row[0], row[1])
+                self._stats["disk_evictions"] += 1
+        self._db.commit()
+
+
+class SingleFlight:
+    """Coalesces concurrent async calls for the same key into one upstream call.
+
+    Callers that arrive while a call for their key is running await the same
+    task. The task is shielded, so one caller disconnecting doesn't cancel the
+    work the others are waiting on.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, "asyncio.Task"] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {"in_flight": len(self._calls), "coalesced": self.coalesced}
@@ -0,0 +1,156 @@
+import asyncio
+import functools
+import os
+from contextlib import AsyncExitStack
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException
+
+from app.limits import ConcurrencyLimiter, retry_with_backoff
+from app.metrics import record_prompt, span
+from app.providers import register
+
+# Always use Gemini 2.0 Flash
+GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
+GEMINI_MODEL = 'gemini-2.0-flash'
+
+GEMINI_MAX_IN_FLIGHT = int(os.getenv("GEMINI_MAX_IN_FLIGHT", "4"))
+GEMINI_MAX_WAITING = int(os.getenv("GEMINI_MAX_WAITING", "32"))
+GEMINI_QUEUE_TIMEOUT = float(os.getenv("GEMINI_QUEUE_TIMEOUT", "30"))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "120"))
+GEMINI_RETRIES = int(os.getenv("GEMINI_RETRIES", "3"))
+GEMINI_BACKOFF_BASE = float(os.getenv("GEMINI_BACKOFF_BASE", "1"))
+GEMINI_BACKOFF_MAX = float(os.getenv("GEMINI_BACKOFF_MAX", "20"))
+
+
+def _load_model():
+    # google-generativeai takes about a second and ~100 MB to import, so it is only loaded on first use
+    import google.generativeai as genai
+
+    genai.configure(api_key=GOOGLE_API_KEY)
+    return genai.GenerativeModel(GEMINI_MODEL)
+
+
+gemini_model = register("gemini", _load_model)
+
+
+@functools.lru_cache(maxsize=None)
+def retryable_errors() -> tuple:
+    from google.api_core import exceptions as google_exceptions
+
+    return (
+        google_exceptions.ResourceExhausted,
+        google_exceptions.TooManyRequests,
+        google_exceptions.ServiceUnavailable,
+    )
+
+
+gemini_limiter = ConcurrencyLimiter(
+    "Gemini", GEMINI_MAX_IN_FLIGHT, GEMINI_MAX_WAITING, GEMINI_QUEUE_TIMEOUT, stage="gemini_queue"
+)
+
+
+async def _with_retries(call):
+    retryable = retryable_errors()
+    try:
+        return await retry_with_backoff(call, retryable, GEMINI_RETRIES, GEMINI_BACKOFF_BASE, GEMINI_BACKOFF_MAX)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Gemini did not respond in time.")
+    except retryable as e:
+        from google.api_core import exceptions as google_exceptions
+
+        if isinstance(e, google_exceptions.ServiceUnavailable):
+            raise HTTPException(
+                status_code=503,
+                detail=f"Gemini is unavailable: {e}",
+                headers={"Retry-After": str(max(1, int(GEMINI_BACKOFF_MAX)))},
+            )
+        raise HTTPException(status_code=429, detail=f"Gemini is rate limiting requests: {e}")
+
+
+async def generate(prompt: str, background: bool = False) -> str:
+    """Run a Gemini completion on the async client, within the concurrency limit.
+
+    Background calls wait for a slot however long it takes instead of getting a 503.
+    """
+    record_prompt("gemini", prompt)
+    model = await gemini_model.aget()
+    async with gemini_limiter.slot(background):
+        with span("gemini"):
+            response = await _with_retries(
+                lambda: asyncio.wait_for(model.generate_content_async(prompt), GEMINI_TIMEOUT)
+            )
+            return response.text
+
+
+class GeminiStream:
+    """Text chunks of one streamed Gemini response, holding a concurrency slot until closed.
+
+    aclose() is idempotent and also works if iteration never started, so it can
+    be called both by the consumer and as a response background task.
+    """
+
+    def __init__(self, chunks: AsyncIterator, first: Optional[str], resources: AsyncExitStack):
+        self._chunks = chunks
+        self._pending = first
+        self._resources = resources
+        self._closed = False
+
+    def __aiter__(self) -> "GeminiStream":
+        return self
+
+    async def __anext__(self) -> str:
+        if self._pending is not None:
+            text, self._pending = self._pending, None
+            return text
+        if self._closed:
+            raise StopAsyncIteration
+        try:
+            chunk = await asyncio.wait_for(self._chunks.__anext__(), GEMINI_TIMEOUT)
+        except StopAsyncIteration:
+            await self.aclose()
+            raise
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="Gemini stream stalled.")
+        return chunk.text
+
+    async def aclose(self) -> None:
+        if not self._closed:
+            self._closed = True
+            await self._resources.aclose()
+
+
+async def open_stream(prompt: str) -> GeminiStream:
+    """Start a streamed Gemini completion and wait for its first chunk.
+
+    Queueing, rate limit and timeout errors are raised here, before any response
+    has been sent, so endpoints can still answer with a real HTTP status.
+    Retries only apply until the first chunk is received; after that a stall of
+    more than GEMINI_TIMEOUT between chunks ends the stream.
+    """
+    record_prompt("gemini", prompt)
+    model = await gemini_model.aget()
+
+    async def start():
+        response = await asyncio.wait_for(model.generate_content_async(prompt, stream=True), GEMINI_TIMEOUT)
+        chunks = response.__aiter__()
+        try:
+            first = await asyncio.wait_for(chunks.__anext__(), GEMINI_TIMEOUT)
+        except StopAsyncIteration:
+            return chunks, None
+        except BaseException:
+            await chunks.aclose()
+            raise
+        return chunks, first.text
+
+    resources = AsyncExitStack()
+    try:
+        await resources.enter_async_context(gemini_limiter.slot())
+        resources.enter_context(span("gemini"))
+        with span("gemini_first_token"):
+            chunks, first = await _with_retries(start)
+        resources.push_async_callback(chunks.aclose)
+    except BaseException:
+        await resources.aclose()
+        raise
+    return GeminiStream(chunks, first, resources)
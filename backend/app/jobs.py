@@ -0,0 +1,368 @@
+import asyncio
+import functools
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from app import gemini
+from app.answer_cache import answer_key
+from app.batch import BATCH_PROMPT_VERSION, chunk_count, research_papers
+from app.limits import backoff_delay
+from app.metrics import span
+from app.pdf_ingest import load_pages
+from app.streaming import sse_event
+
+# Background jobs summarize one (large) PDF with the batch map-reduce instead of
+# holding the request open. Job state, progress and results are kept in SQLite
+# in JOB_DIR (created on the first submission), so finished results survive
+# restarts and jobs that were queued or running when the server stopped are
+# picked up again at the next startup.
+JOB_DIR = os.getenv("JOB_DIR", "jobs")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_QUEUED = int(os.getenv("JOB_MAX_QUEUED", "100"))
+# Gemini calls in flight per job, and across all jobs. The total is kept below GEMINI_MAX_IN_FLIGHT
+# so interactive requests always have a slot; jobs wait for Gemini slots rather than being rejected.
+JOB_MAP_CONCURRENCY = int(os.getenv("JOB_MAP_CONCURRENCY", "2"))
+JOB_GEMINI_SLOTS = int(os.getenv("JOB_GEMINI_SLOTS", str(max(1, gemini.GEMINI_MAX_IN_FLIGHT - 1))))
+# Jobs that hit Gemini rate limits or outages (429/503) are requeued with backoff this many times
+JOB_RETRIES = int(os.getenv("JOB_RETRIES", "5"))
+JOB_RETRY_BASE = float(os.getenv("JOB_RETRY_BASE", "30"))
+JOB_RETRY_MAX = float(os.getenv("JOB_RETRY_MAX", "600"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(7 * 24 * 3600)))  # seconds finished jobs are kept
+
+JOB_PROCESS = (
+    "The full PDF was summarized section by section with Google's Gemini 2.0 Flash, "
+    "and the section notes were then synthesized into one answer."
+)
+
+ACTIVE = ("queued", "running")
+JOB_DB_NAME = "jobs.db"
+
+
+class JobStore:
+    """SQLite table of jobs in a data directory, which also holds the uploaded PDFs of jobs that haven't finished yet."""
+
+    def __init__(self, directory: str):
+        self._documents = os.path.join(directory, "documents")
+        os.makedirs(self._documents, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, JOB_DB_NAME), check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "id TEXT PRIMARY KEY, dedup_key TEXT NOT NULL, status TEXT NOT NULL, stage TEXT NOT NULL, "
+            "query TEXT NOT NULL, title TEXT NOT NULL, doc_hash TEXT NOT NULL, "
+            "pages_total INTEGER NOT NULL DEFAULT 0, pages_extracted INTEGER NOT NULL DEFAULT 0, "
+            "chunks_total INTEGER NOT NULL DEFAULT 0, chunks_summarized INTEGER NOT NULL DEFAULT 0, "
+            "result TEXT, error TEXT, created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_dedup_key ON jobs (dedup_key)")
+        self._db.commit()
+
+    def document_path(self, job_id: str) -> str:
+        return os.path.join(self._documents, f"{job_id}.pdf")
+
+    def submit(
+        self, dedup_key: str, query: str, title: str, doc_hash: str, path: str, max_queued: int
+    ) -> Tuple[dict, bool]:
+        """Queue a new job for the PDF at path, or return the existing queued, running or finished job with the same dedup key.
+
+        The second value is True when a new job was created, in which case the
+        file at path has been moved into the store.
+        """
+        with self._lock:
+            existing = self._existing(dedup_key, max_queued)
+        if existing is not None:
+            return existing, False
+        job_id = uuid.uuid4().hex
+        document = self.document_path(job_id)
+        # Outside the lock: a rename, or a copy when JOB_DIR is on another filesystem than the upload
+        shutil.move(path, document)
+        try:
+            with self._lock:
+                # An identical job may have been submitted in the meantime
+                existing = self._existing(dedup_key, max_queued)
+                if existing is None:
+                    now = time.time()
+                    self._db.execute(
+                        "INSERT INTO jobs (id, dedup_key, status, stage, query, title, doc_hash, created, updated) "
+                        "VALUES (?, ?, 'queued', 'queued', ?, ?, ?, ?, ?)",
+                        (job_id, dedup_key, query, title, doc_hash, now, now),
+                    )
+                    self._db.commit()
+                    return self._get(job_id), True
+        except BaseException:
+            os.unlink(document)
+            raise
+        os.unlink(document)
+        return existing, False
+
+    def _existing(self, dedup_key: str, max_queued: int) -> Optional[dict]:
+        """The job a submission with this dedup key joins, or None if it needs a new one (503 if the queue is full)."""
+        row = self._db.execute(
+            "SELECT * FROM jobs WHERE dedup_key = ? AND status != 'failed' ORDER BY created DESC LIMIT 1",
+            (dedup_key,),
+        ).fetchone()
+        if row is not None:
+            return _job(row)
+        queued = self._db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        if queued >= max_queued:
+            raise HTTPException(
+                status_code=503,
+                detail=f"Too many jobs are waiting ({queued}). Please retry later.",
+                headers={"Retry-After": "60"},
+            )
+        return None
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            return self._get(job_id)
+
+    def _get(self, job_id: str) -> Optional[dict]:
+        row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job(row) if row is not None else None
+
+    def claim(self, job_id: str) -> bool:
+        """Mark a queued job running; False if it isn't queued (e.g. already claimed)."""
+        with self._lock:
+            claimed = self._db.execute(
+                "UPDATE jobs SET status = 'running', updated = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id),
+            ).rowcount
+            self._db.commit()
+        return claimed == 1
+
+    def update(self, job_id: str, **fields) -> None:
+        fields["updated"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+            self._db.commit()
+
+    def requeue(self, job_id: str) -> None:
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'queued', stage = 'queued', pages_extracted = 0, chunks_summarized = 0, "
+                "updated = ? WHERE id = ?",
+                (time.time(), job_id),
+            )
+            self._db.commit()
+
+    def finish(self, job_id: str, result: Optional[dict] = None, error: Optional[str] = None) -> None:
+        """Store a job's result (or error) and drop its PDF."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, stage = ?, result = ?, error = ?, updated = ? WHERE id = ?",
+                (
+                    "failed" if error is not None else "done",
+                    "failed" if error is not None else "done",
+                    json.dumps(result) if result is not None else None,
+                    error,
+                    time.time(),
+                    job_id,
+                ),
+            )
+            self._db.commit()
+        try:
+            os.unlink(self.document_path(job_id))
+        except FileNotFoundError:
+            pass
+
+    def recover(self, retention: float) -> List[str]:
+        """Requeue jobs interrupted by a restart, prune old finished jobs, and return the queued job ids in order."""
+        with self._lock:
+            self._db.execute(
+                "UPDATE jobs SET status = 'queued', stage = 'queued', pages_extracted = 0, chunks_summarized = 0 "
+                "WHERE status = 'running'"
+            )
+            self._db.execute(
+                "DELETE FROM jobs WHERE status NOT IN ('queued', 'running') AND updated < ?", (time.time() - retention,)
+            )
+            self._db.commit()
+            queued = [row[0] for row in self._db.execute("SELECT id FROM jobs WHERE status = 'queued' ORDER BY created")]
+        # PDFs left behind by jobs that finished or were pruned while the server was down
+        for name in os.listdir(self._documents):
+            if name[: -len(".pdf")] not in queued:
+                os.unlink(os.path.join(self._documents, name))
+        return queued
+
+    def counts(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+def _job(row: sqlite3.Row) -> dict:
+    job = dict(row)
+    del job["dedup_key"]
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+class JobManager:
+    """Runs queued jobs on a fixed number of worker tasks started with the app."""
+
+    def __init__(self, directory: str = JOB_DIR, workers: int = JOB_WORKERS):
+        self.directory = directory
+        self.workers = workers
+        self._store: Optional[JobStore] = None
+        self._open_lock = threading.Lock()
+        # Store calls run in order on one thread, keeping SQLite off the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="job-store")
+        self._queue: Optional[asyncio.Queue] = None
+        self._gemini_slots: Optional[asyncio.Semaphore] = None
+        self._retries: Dict[str, int] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def _open(self, create: bool) -> Optional[JobStore]:
+        # Created on the first submission, so a server that never runs jobs doesn't create JOB_DIR
+        with self._open_lock:
+            if self._store is None and (create or os.path.exists(os.path.join(self.directory, JOB_DB_NAME))):
+                self._store = JobStore(self.directory)
+        return self._store
+
+    async def _call(self, fn: Callable, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def _update(self, job_id: str, **fields) -> None:
+        # Progress callbacks are synchronous, so their writes are queued on the store thread without waiting
+        self._executor.submit(self._store.update, job_id, **fields)
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._gemini_slots = asyncio.Semaphore(JOB_GEMINI_SLOTS)
+        store = await self._call(self._open, False)
+        if store is not None:
+            for job_id in await self._call(store.recover, JOB_RETENTION):
+                self._queue.put_nowait(job_id)
+        if self._queue.qsize():
+            print(f"Resuming {self._queue.qsize()} queued job(s)")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        # Interrupted jobs stay "running" in the store and are requeued by the next start()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, query: str, title: str, path: str, doc_hash: str) -> Tuple[dict, bool]:
+        """Queue a job for this PDF and query; identical submissions share one job. Returns (job, created)."""
+        dedup_key = answer_key(doc_hash, query, gemini.GEMINI_MODEL, BATCH_PROMPT_VERSION)
+        loop = asyncio.get_running_loop()
+        # Moving the PDF into JOB_DIR can mean a copy, so it runs on the default executor
+        # rather than holding up the store thread
+        job, created = await loop.run_in_executor(
+            None, lambda: self._open(True).submit(dedup_key, query, title, doc_hash, path, JOB_MAX_QUEUED)
+        )
+        if created:
+            self._queue.put_nowait(job["id"])
+        return job, created
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        def get() -> Optional[dict]:
+            store = self._open(False)
+            return store.get(job_id) if store is not None else None
+
+        return await self._call(get)
+
+    async def events(self, job_id: str) -> AsyncIterator[str]:
+        """SSE stream of a job: a progress event whenever its state changes, then done or error."""
+        last = None
+        while True:
+            job = await self.get(job_id)
+            if job is None:
+                yield sse_event("error", {"detail": "Job not found."})
+                return
+            state = {k: v for k, v in job.items() if k != "result"}
+            if state != last:
+                yield sse_event("progress", state)
+                last = state
+            if job["status"] == "done":
+                yield sse_event("done", job["result"])
+                return
+            if job["status"] == "failed":
+                yield sse_event("error", {"detail": job["error"]})
+                return
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                if await self._call(self._store.claim, job_id):
+                    await self._run(job_id)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        store = self._store
+        job = await self._call(store.get, job_id)
+        try:
+            with span("job"):
+                path = store.document_path(job_id)
+                if not os.path.exists(path):
+                    raise RuntimeError("The uploaded PDF is no longer available; please submit it again.")
+                self._update(job_id, stage="extract")
+                pages = await load_pages(
+                    path,
+                    job["doc_hash"],
+                    lambda extracted, total: self._update(job_id, pages_extracted=extracted, pages_total=total),
+                )
+
+                total = chunk_count(pages)
+                self._update(job_id, stage="summarize", pages_total=len(pages), chunks_total=total)
+                summarized = 0
+
+                def on_chunk() -> None:
+                    nonlocal summarized
+                    summarized += 1
+                    # Once every section has notes, the remaining calls merge them
+                    stage = "reduce" if summarized >= total else "summarize"
+                    self._update(job_id, chunks_summarized=summarized, stage=stage)
+
+                summary, sources = await research_papers(
+                    job["query"], [(job["title"], pages)], JOB_MAP_CONCURRENCY, on_chunk, self._gemini_slots
+                )
+            result = {"summary": summary, "sources": sources, "process": JOB_PROCESS}
+            await self._finish(job_id, result=result)
+        except HTTPException as e:
+            if e.status_code in (429, 503) and self._retries.get(job_id, 0) < JOB_RETRIES:
+                await self._retry_later(job_id, str(e.detail))
+            else:
+                await self._finish(job_id, error=str(e.detail))
+        except Exception as e:
+            print(f"Error in job {job_id}: {e}")
+            await self._finish(job_id, error=str(e))
+
+    async def _finish(self, job_id: str, **outcome) -> None:
+        self._retries.pop(job_id, None)
+        await self._call(self._store.finish, job_id, **outcome)
+
+    async def _retry_later(self, job_id: str, reason: str) -> None:
+        # Gemini is rate limiting or unavailable: queue the job again instead of failing it,
+        # since a failed job isn't deduplicated and would need a new upload
+        attempt = self._retries.get(job_id, 0)
+        self._retries[job_id] = attempt + 1
+        delay = JOB_RETRY_BASE + backoff_delay(attempt, JOB_RETRY_BASE, JOB_RETRY_MAX)
+        print(f"Job {job_id} will be retried in {delay:.0f}s: {reason}")
+        await self._call(self._store.requeue, job_id)
+        asyncio.get_running_loop().call_later(delay, self._queue.put_nowait, job_id)
+
+    def stats(self) -> dict:
+        counts = self._store.counts() if self._store is not None else {}
+        counts["workers"] = len(self._tasks)
+        return counts
+
+
+job_manager = JobManager()
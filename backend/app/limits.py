@@ -0,0 +1,160 @@
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Tuple, Type, TypeVar
+
+from fastapi import HTTPException
+
+from app.metrics import span
+
+T = TypeVar("T")
+
+
+class ConcurrencyLimiter:
+    """Caps in-flight calls to a provider and bounds how many callers may queue for a slot.
+
+    Callers beyond max_waiting, or who wait longer than wait_timeout, are
+    rejected with a 503 so load sheds quickly instead of piling up behind a
+    slow upstream.
+    """
+
+    def __init__(self, name: str, max_in_flight: int, max_waiting: int, wait_timeout: float, stage: str = "queue"):
+        self.name = name
+        self.stage = stage
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self._in_flight = 0
+        self._waiting = 0
+        self._background_waiting = 0
+        self._rejected = 0
+
+    def _reject(self, reason: str) -> HTTPException:
+        self._rejected += 1
+        return HTTPException(
+            status_code=503,
+            detail=f"{self.name} is busy ({reason}). Please retry shortly.",
+            headers={"Retry-After": str(max(1, int(self.wait_timeout)))},
+        )
+
+    @asynccontextmanager
+    async def slot(self, background: bool = False):
+        """Hold one of the in-flight slots.
+
+        Background callers (e.g. jobs) wait as long as it takes instead of being
+        rejected, and don't count against the queue cap of interactive requests.
+        """
+        if background:
+            self._background_waiting += 1
+            try:
+                with span(self.stage):
+                    await self._semaphore.acquire()
+            finally:
+                self._background_waiting -= 1
+        else:
+            if self._in_flight + self._waiting >= self.max_in_flight + self.max_waiting:
+                raise self._reject("queue full")
+            self._waiting += 1
+            try:
+                with span(self.stage):
+                    await asyncio.wait_for(self._semaphore.acquire(), self.wait_timeout)
+            except asyncio.TimeoutError:
+                raise self._reject("timed out waiting for a slot")
+            finally:
+                self._waiting -= 1
+        self._in_flight += 1
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+
+    @property
+    def busy(self) -> bool:
+        return self._in_flight + self._waiting > 0
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "background_waiting": self._background_waiting,
+            "rejected": self._rejected,
+            "max_in_flight": self.max_in_flight,
+            "max_waiting": self.max_waiting,
+        }
+
+
+class TokenBucket:
+    """Async token-bucket rate limiter shared by every caller of one upstream.
+
+    Besides the steady refill rate it keeps backoff state: each reported rate
+    limit pauses the bucket for an exponentially growing, jittered interval,
+    and the next success resets it.
+    """
+
+    def __init__(self, rate: float, capacity: int, base_delay: float, max_delay: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._failures = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def record_success(self) -> None:
+        self._failures = 0
+
+    def record_rate_limit(self) -> float:
+        delay = min(self.max_delay, self.base_delay * (2 ** self._failures)) * random.uniform(0.5, 1.0)
+        self._failures += 1
+        self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        return delay
+
+    def stats(self) -> dict:
+        return {
+            "tokens": round(self._tokens, 2),
+            "consecutive_rate_limits": self._failures,
+            "blocked_for": round(max(0.0, self._blocked_until - time.monotonic()), 2),
+        }
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    # "Full jitter" exponential backoff: spreads retries from concurrent callers apart.
+    return random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+
+
+async def retry_with_backoff(
+    call: Callable[[], Awaitable[T]],
+    retry_on: Tuple[Type[BaseException], ...],
+    attempts: int,
+    base_delay: float,
+    max_delay: float,
+) -> T:
+    for attempt in range(attempts):
+        try:
+            return await call()
+        except retry_on as e:
+            if attempt == attempts - 1:
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            print(f"Retryable provider error ({e}); retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+    raise RuntimeError("retry_with_backoff called with attempts < 1")
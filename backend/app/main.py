@@ -1,35 +1,34 @@
 from fastapi import FastAPI, HTTPException, File, UploadFile, Form
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Iterable, List, Optional
 import os
 from dotenv import load_dotenv
-from langchain_community.chat_models import ChatOllama
-from langchain.prompts import ChatPromptTemplate
-from langchain.chains import LLMChain
-from langchain_core.messages import HumanMessage, SystemMessage
-from duckduckgo_search import DDGS
-from duckduckgo_search.exceptions import DuckDuckGoSearchException
-import requests
 import asyncio
-import concurrent.futures
-import traceback
-import time
-import random
-import json
 import re
-import base64
-import google.generativeai as genai
-from PyPDF2 import PdfReader
-import io
+from contextlib import AsyncExitStack
+from itertools import repeat
 
 # === More local LLMs you can use with Ollama/LMStudio (no API needed) ===
 # - llama2, llama3, mistral, phi3, deepseek-llm, deepseek-coder, qwen1.5, qwen2, gemma, codellama, yi, solar, openhermes, neural-chat, etc.
 # See https://ollama.com/library for more.
 
-# Load environment variables
+# Load environment variables (before importing app modules, which read their settings at import time)
 load_dotenv()
 
+from app.pdf_ingest import saved_upload, load_pages, shutdown_pdf_pool, pdf_text_cache
+from app.retrieval import retrieve, format_chunks, TOP_K as RETRIEVAL_TOP_K, CHUNK_WORDS, CHUNK_OVERLAP
+from app.streaming import sse_response, stream_tokens, cached_events
+from app import gemini
+from app.search import search_web, search_cache_stats, get_search_executor, shutdown_search_executor
+from app.ollama import ollama_registry, OLLAMA_WARMUP_MODELS
+from app.batch import research_papers, BATCH_MAX_FILES, BATCH_PROMPT_VERSION
+from app.answer_cache import answer_cache, answer_key, prompt_version, content_hash, combined_hash
+from app.metrics import MetricsMiddleware, register_collector, render_metrics, span
+from app.providers import PRELOAD_PROVIDERS, preload, provider_stats
+from app.jobs import job_manager
+
 app = FastAPI()
 
 # Configure CORS
@@ -39,12 +38,11 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
-# Always use Gemini 2.0 Flash
-GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=GOOGLE_API_KEY)
-model = genai.GenerativeModel('gemini-2.0-flash')
+# Per-stage timings: Server-Timing response headers plus histograms served at /metrics
+app.add_middleware(MetricsMiddleware)
 
 # Preserve ColiVara code as comments for future use
 """
@@ -52,6 +50,25 @@ from colivara_py import ColiVara
 colivara_client = ColiVara(api_key=os.getenv("COLIVARA_API_KEY"))
 """
 
+@app.on_event("startup")
+async def start_workers():
+    get_search_executor()
+    if OLLAMA_WARMUP_MODELS:
+        # Load local models in the background so startup isn't held up by Ollama
+        app.state.ollama_warmup = asyncio.create_task(ollama_registry.warm_up(OLLAMA_WARMUP_MODELS))
+    if PRELOAD_PROVIDERS:
+        # Provider SDKs are otherwise imported on first use; preloading keeps that off the first request
+        app.state.provider_preload = asyncio.get_running_loop().run_in_executor(None, preload, PRELOAD_PROVIDERS)
+    # Resumes jobs left queued or running by the previous run
+    await job_manager.start()
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    await job_manager.stop()
+    shutdown_pdf_pool()
+    shutdown_search_executor()
+    await ollama_registry.aclose()
+
 class ResearchRequest(BaseModel):
     query: str
     context: Optional[str] = None
@@ -61,30 +78,12 @@ class ResearchResponse(BaseModel):
     sources: List[dict]
     process: str = ""
 
-@app.post("/api/research", response_model=ResearchResponse)
-async def research(
-    query: str = Form(...),
-    file: Optional[UploadFile] = File(None)
-):
-    try:
-        if not file:
-            raise HTTPException(status_code=400, detail="PDF file is required for research.")
-        
-        # Save the uploaded file
-        file_location = f"temp_{file.filename}"
-        with open(file_location, "wb") as file_object:
-            file_object.write(await file.read())
-
-        # Read PDF content
-        pdf_reader = PdfReader(file_location)
-        pdf_text = ""
-        for page in pdf_reader.pages:
-            pdf_text += page.extract_text()
+RESEARCH_PROCESS = "Research conducted using Google's Gemini 2.0 Flash AI model."
 
-        # Create prompt
-        prompt = f"""Please analyze the following PDF content and answer the query: {query}
+def research_prompt(query: str, pdf_text: str) -> str:
+    return f"""Please analyze the following excerpts from a PDF and answer the query: {query}
 
-PDF Content:
+PDF Excerpts (each tagged with the page it came from):
 {pdf_text}
 
 Please provide:
@@ -95,34 +94,248 @@ Please provide:
 
 Format your response in a clear, structured way."""
 
-        # Use Gemini 2.0 Flash
-        response = model.generate_content(prompt)
-        summary = response.text
+# Cached answers are invalidated automatically when the prompt or retrieval settings change
+RESEARCH_PROMPT_VERSION = prompt_version(
+    research_prompt("{query}", "{context}"), RESEARCH_PROCESS, RETRIEVAL_TOP_K, CHUNK_WORDS, CHUNK_OVERLAP
+)
 
-        sources = [{
-            "title": file.filename,
-            "href": "",
-            "body": pdf_text[:500] + "...",
-            "page_image": "",
-            "page_number": "1"
-        }]
+def retitled(cached: dict, titles: Iterable[str]) -> dict:
+    """A cached answer with this request's filenames on its sources (the cache is keyed by content, not filename)."""
+    return dict(cached, sources=[dict(source, title=title) for source, title in zip(cached["sources"], titles)])
 
-        # Clean up
-        try:
-            os.remove(file_location)
-        except Exception as e:
-            print(f"Warning: could not delete temp file {file_location}: {e}")
+def research_upload(file: Optional[UploadFile]):
+    if not file:
+        raise HTTPException(status_code=400, detail="PDF file is required for research.")
+    # Stream the upload to a temp file in chunks, hashing it as it arrives
+    return saved_upload(file)
 
-        return ResearchResponse(
+async def prepare_research(query: str, title: str, pdf_path: str, doc_hash: str):
+    """Extract and retrieve from the uploaded PDF, returning the Gemini prompt and sources."""
+    # Extract page text off the event loop (cached by content hash)
+    pages = await load_pages(pdf_path, doc_hash)
+
+    # Retrieve only the passages relevant to the query instead of sending the whole PDF
+    loop = asyncio.get_running_loop()
+    with span("retrieve"):
+        chunks = await loop.run_in_executor(None, retrieve, doc_hash, pages, query)
+    prompt = research_prompt(query, format_chunks(chunks))
+
+    sources = [{
+        "title": title,
+        "href": "",
+        "body": chunk["text"][:500] + ("..." if len(chunk["text"]) > 500 else ""),
+        "page_image": "",
+        "page_number": str(chunk["page_number"])
+    } for chunk in chunks]
+    return prompt, sources
+
+@app.post("/api/research", response_model=ResearchResponse)
+async def research(
+    query: str = Form(...),
+    file: Optional[UploadFile] = File(None)
+):
+    try:
+        async with research_upload(file) as (pdf_path, doc_hash):
+            cache_key = answer_key(doc_hash, query, gemini.GEMINI_MODEL, RESEARCH_PROMPT_VERSION)
+            cached = await answer_cache.aget(cache_key)
+            if cached is not None:
+                return ResearchResponse(**retitled(cached, repeat(file.filename)))
+
+            prompt, sources = await prepare_research(query, file.filename, pdf_path, doc_hash)
+
+        # Use Gemini 2.0 Flash (async client, concurrency-limited with retries)
+        summary = await gemini.generate(prompt)
+
+        response = ResearchResponse(
             summary=summary,
             sources=sources,
-            process="Research conducted using Google's Gemini 2.0 Flash AI model."
+            process=RESEARCH_PROCESS
         )
+        await answer_cache.aset(cache_key, response.model_dump())
+        return response
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error in research endpoint: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/research/stream")
+async def research_stream(
+    query: str = Form(...),
+    file: Optional[UploadFile] = File(None)
+):
+    try:
+        async with research_upload(file) as (pdf_path, doc_hash):
+            cache_key = answer_key(doc_hash, query, gemini.GEMINI_MODEL, RESEARCH_PROMPT_VERSION)
+            cached = await answer_cache.aget(cache_key)
+            if cached is not None:
+                return sse_response(cached_events(retitled(cached, repeat(file.filename))))
+            prompt, sources = await prepare_research(query, file.filename, pdf_path, doc_hash)
+        # Wait for a Gemini slot and the first chunk before responding, so a full
+        # queue or rate limit is reported as a 503/429 rather than a 200 with an error event
+        tokens = await gemini.open_stream(prompt)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in research stream endpoint: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def finish(text: str) -> dict:
+        done = {"summary": text, "process": RESEARCH_PROCESS}
+        await answer_cache.aset(cache_key, dict(done, sources=sources))
+        return done
+
+    return sse_response(stream_tokens(tokens, sources, finish), close=tokens.aclose)
+
+@app.post("/api/research/batch", response_model=ResearchResponse)
+async def research_batch(
+    query: str = Form(...),
+    files: List[UploadFile] = File(...)
+):
+    try:
+        if len(files) > BATCH_MAX_FILES:
+            raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_FILES} PDFs can be analyzed per batch.")
+
+        async with AsyncExitStack() as stack:
+            # Save every upload to a temp file, skipping exact duplicates
+            uploads = []
+            seen = set()
+            for file in files:
+                pdf_path, doc_hash = await stack.enter_async_context(saved_upload(file))
+                if doc_hash not in seen:
+                    seen.add(doc_hash)
+                    uploads.append((file.filename, pdf_path, doc_hash))
+
+            cache_key = answer_key(
+                combined_hash(doc_hash for _, _, doc_hash in uploads), query, gemini.GEMINI_MODEL, BATCH_PROMPT_VERSION
+            )
+            cached = await answer_cache.aget(cache_key)
+            if cached is not None:
+                return ResearchResponse(**retitled(cached, (title for title, _, _ in uploads)))
+
+            # Extract all papers in parallel, then map-reduce over them
+            all_pages = await asyncio.gather(*(load_pages(pdf_path, doc_hash) for _, pdf_path, doc_hash in uploads))
+        papers = [(title, pages) for (title, _, _), pages in zip(uploads, all_pages)]
+
+        summary, sources = await research_papers(query, papers)
+        response = ResearchResponse(
+            summary=summary,
+            sources=sources,
+            process=f"Each of the {len(papers)} papers was analyzed separately with Google's Gemini 2.0 Flash, "
+                    "and the per-paper notes were then synthesized into one answer."
+        )
+        await answer_cache.aset(cache_key, response.model_dump())
+        return response
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error in research batch endpoint: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+class JobResponse(BaseModel):
+    id: str
+    status: str  # queued, running, done or failed
+    stage: str  # queued, extract, summarize, reduce, done or failed
+    query: str
+    title: str
+    pages_total: int
+    pages_extracted: int
+    chunks_total: int
+    chunks_summarized: int
+    result: Optional[ResearchResponse] = None
+    error: Optional[str] = None
+    created: float
+    updated: float
+    deduplicated: bool = False
+
+@app.post("/api/jobs", response_model=JobResponse, status_code=202)
+async def submit_job(
+    query: str = Form(...),
+    file: Optional[UploadFile] = File(None)
+):
+    # Returns as soon as the upload is stored; the job runs on the background workers
+    async with research_upload(file) as (pdf_path, doc_hash):
+        job, created = await job_manager.submit(query, file.filename, pdf_path, doc_hash)
+    return JobResponse(**job, deduplicated=not created)
+
+async def get_job_or_404(job_id: str) -> dict:
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+@app.get("/api/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    return JobResponse(**await get_job_or_404(job_id))
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    await get_job_or_404(job_id)
+    return sse_response(job_manager.events(job_id))
+
+def all_cache_stats() -> dict:
+    return {
+        "pdf_text": pdf_text_cache.stats(),
+        "search": search_cache_stats(),
+        "answers": answer_cache.stats(),
+    }
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return all_cache_stats()
+
+CACHE_EVENTS = ("hits", "disk_hits", "misses", "expired", "evictions", "disk_evictions", "coalesced")
+
+def cache_metrics() -> dict:
+    caches = all_cache_stats()
+    return {
+        "cache_events_total": [
+            ({"cache": name, "event": event}, stats[event])
+            for name, stats in caches.items() for event in CACHE_EVENTS if event in stats
+        ],
+        "cache_bytes": [({"cache": name}, stats["bytes"]) for name, stats in caches.items()],
+    }
+
+# provider_rejected_total only ever grows, so it is exported as a counter
+LIMITER_METRICS = {"provider_in_flight": "in_flight", "provider_waiting": "waiting", "provider_rejected_total": "rejected"}
+
+def limiter_metrics() -> dict:
+    limiters = {"gemini": gemini.gemini_limiter.stats()}
+    limiters.update({f"ollama/{model}": stats for model, stats in ollama_registry.stats().items()})
+    return {
+        name: [({"provider": provider}, stats[key]) for provider, stats in limiters.items()]
+        for name, key in LIMITER_METRICS.items()
+    }
+
+def provider_load_metrics() -> dict:
+    providers = provider_stats()
+    return {
+        "provider_loaded": [({"provider": name}, int(stats["loaded"])) for name, stats in providers.items()],
+        "provider_load_ms": [
+            ({"provider": name}, stats["load_ms"]) for name, stats in providers.items() if stats["load_ms"] is not None
+        ],
+    }
+
+def job_metrics() -> dict:
+    stats = job_manager.stats()
+    return {
+        "jobs": [({"status": status}, stats.get(status, 0)) for status in ("queued", "running", "done", "failed")],
+        "job_workers": [({}, stats["workers"])],
+    }
+
+register_collector(cache_metrics, counters=["cache_events_total"])
+register_collector(limiter_metrics, counters=["provider_rejected_total"])
+register_collector(provider_load_metrics)
+register_collector(job_metrics)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    # Collectors read SQLite (job counts), so rendering runs off the event loop
+    text = await asyncio.get_running_loop().run_in_executor(None, render_metrics)
+    return PlainTextResponse(text, media_type="text/plain; version=0.0.4")
+
 # Preserve ColiVara implementation as comments
 """
 @app.post("/api/research", response_model=ResearchResponse)
@@ -194,76 +407,6 @@ async def research(
         raise HTTPException(status_code=500, detail=str(e))
 """
 
-def duckduckgo_search_sync(query: str, max_results: int = 3) -> list:
-    results = []
-    try:
-        # Add a small random delay to avoid rate limiting
-        time.sleep(random.uniform(1, 3))
-        
-        # Configure DDGS with browser-like headers
-        with DDGS() as ddgs:
-            # Set custom headers to appear more like a regular browser
-            ddgs.headers = {
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'en-US,en;q=0.5',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'DNT': '1',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-                'Sec-Fetch-Dest': 'document',
-                'Sec-Fetch-Mode': 'navigate',
-                'Sec-Fetch-Site': 'none',
-                'Sec-Fetch-User': '?1',
-                'Cache-Control': 'max-age=0'
-            }
-            
-            # Use a more conservative search approach
-            for r in ddgs.text(
-                query,
-                region="wt-wt",
-                safesearch="Moderate",
-                max_results=max_results,
-                backend="lite"  # Use lite backend which is less likely to trigger rate limits
-            ):
-                results.append({
-                    "title": r.get("title"),
-                    "body": r.get("body"),
-                    "href": r.get("href")
-                })
-                
-                # Add a small delay between results
-                time.sleep(random.uniform(0.5, 1))
-                
-    except DuckDuckGoSearchException as e:
-        print(f"[DuckDuckGo] Search error: {e}")
-        # If we hit a rate limit, wait longer and try one more time
-        if "rate limit" in str(e).lower():
-            print("Rate limit detected, waiting 30 seconds before retry...")
-            time.sleep(30)
-            try:
-                with DDGS() as ddgs:
-                    for r in ddgs.text(
-                        query,
-                        region="wt-wt",
-                        safesearch="Moderate",
-                        max_results=max_results,
-                        backend="lite"
-                    ):
-                        results.append({
-                            "title": r.get("title"),
-                            "body": r.get("body"),
-                            "href": r.get("href")
-                        })
-            except Exception as retry_e:
-                print(f"[DuckDuckGo] Retry search error: {retry_e}")
-                return []
-        return []
-    except Exception as e:
-        print(f"[DuckDuckGo] Unexpected error: {e}")
-        return []
-    return results
-
 def extract_sections(text):
     def get_section(name, next_names):
         next_pattern = "|".join([re.escape(n) for n in next_names])
@@ -286,30 +429,56 @@ def extract_sections(text):
         summary_full += f"\n\nFuture Trends:\n{future}"
     return summary_full.strip(), process.strip(), sources.strip()
 
-@app.post("/api/websearch")
-async def websearch(payload: dict):
+async def prepare_websearch(payload: dict):
+    """Run the web search for a payload, returning the Ollama client, prompt, web results and answer cache key."""
     query = payload.get("query")
     model = payload.get("model", "llama3")
     if not query:
         raise HTTPException(status_code=400, detail="Query is required.")
-    llm = ChatOllama(
-        base_url="http://localhost:11434",
-        model=model,
-        temperature=0.7
-    )
-    loop = asyncio.get_event_loop()
-    with concurrent.futures.ProcessPoolExecutor() as pool:
-        web_results = await loop.run_in_executor(pool, duckduckgo_search_sync, query)
+    llm = await ollama_registry.get(model)
+    with span("search"):
+        web_results = await search_web(query)
     context = "\n".join([f"{r['title']}: {r['body']} ({r['href']})" for r in web_results])
     prompt = create_prompt(query, context)
+    cache_key = answer_key(content_hash(context), query, f"ollama/{model}", WEBSEARCH_PROMPT_VERSION)
+    return llm, prompt, web_results, cache_key
+
+@app.post("/api/websearch")
+async def websearch(payload: dict):
+    llm, prompt, web_results, cache_key = await prepare_websearch(payload)
+    cached = await answer_cache.aget(cache_key)
+    if cached is not None:
+        return cached
     result = await llm.ainvoke(prompt)
     result_text = result.content if hasattr(result, "content") else str(result)
-    summary, process, _ = extract_sections(result_text)
-    return {
+    with span("parse"):
+        summary, process, _ = extract_sections(result_text)
+    response = {
         "summary": summary,
         "sources": web_results,
         "process": process
     }
+    await answer_cache.aset(cache_key, response)
+    return response
+
+@app.post("/api/websearch/stream")
+async def websearch_stream(payload: dict):
+    llm, prompt, web_results, cache_key = await prepare_websearch(payload)
+    cached = await answer_cache.aget(cache_key)
+    if cached is not None:
+        return sse_response(cached_events(cached))
+    # Wait for a model slot and the first message before responding, so a full
+    # queue or an Ollama error is reported as a real 503/502 rather than an error event
+    tokens = await llm.open_stream(prompt)
+
+    async def finish(text: str) -> dict:
+        with span("parse"):
+            summary, process, _ = extract_sections(text)
+        done = {"summary": summary, "process": process}
+        await answer_cache.aset(cache_key, dict(done, sources=web_results))
+        return done
+
+    return sse_response(stream_tokens(tokens, web_results, finish), close=tokens.aclose)
 
 def create_prompt(query: str, context: str) -> str:
     return (
@@ -331,6 +500,9 @@ def create_prompt(query: str, context: str) -> str:
         f"Research Question:\n{query}\n"
     )
 
+# Cached web answers are invalidated automatically when create_prompt() changes
+WEBSEARCH_PROMPT_VERSION = prompt_version(create_prompt("{query}", "{context}"))
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000) 
\ No newline at end of file
@@ -0,0 +1,261 @@
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+# Per-request stage timings, shared by every task spawned while handling the request.
+_request_spans: contextvars.ContextVar[Optional[List[Tuple[str, float]]]] = contextvars.ContextVar(
+    "request_spans", default=None
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+SIZE_BUCKETS = (1e3, 5e3, 1e4, 5e4, 1e5, 2.5e5, 5e5, 1e6, 2.5e6)
+PAGE_BUCKETS = (1, 5, 10, 25, 50, 100, 200, 300, 500, 1000)
+
+# Requests slower than this (ms) have the stacks sampled during them written to PROFILE_DIR; unset disables
+# profiling. One sampler covers the whole process, so concurrent requests appear in each other's profiles.
+SLOW_REQUEST_PROFILE_MS = float(os.getenv("SLOW_REQUEST_PROFILE_MS", "0"))
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+
+class Histogram:
+    """Prometheus-style cumulative histogram with optional labels."""
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._series: Dict[Tuple[Tuple[str, str], ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                labels = [f'{k}="{_escape(v)}"' for k, v in key]
+                for bound, bucket_count in zip(self.buckets, counts):
+                    lines.append(f"{self.name}_bucket{{{_join(labels, 'le', f'{bound:g}')}}} {bucket_count}")
+                lines.append(f"{self.name}_bucket{{{_join(labels, 'le', '+Inf')}}} {count}")
+                suffix = f"{{{','.join(labels)}}}" if labels else ""
+                lines.append(f"{self.name}_sum{suffix} {total}")
+                lines.append(f"{self.name}_count{suffix} {count}")
+        return lines
+
+
+def _join(labels: List[str], name: str, value: str) -> str:
+    return ",".join(labels + [f'{name}="{value}"'])
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+request_seconds = Histogram("http_request_duration_seconds", "HTTP request latency.", LATENCY_BUCKETS)
+stage_seconds = Histogram("research_stage_duration_seconds", "Latency of each request stage.", LATENCY_BUCKETS)
+prompt_chars = Histogram("llm_prompt_chars", "Characters sent to the LLM per call.", SIZE_BUCKETS)
+prompt_tokens = Histogram("llm_prompt_tokens_estimate", "Estimated tokens (chars / 4) sent to the LLM per call.", SIZE_BUCKETS)
+pdf_pages = Histogram("pdf_pages", "Page count of extracted PDFs.", PAGE_BUCKETS)
+HISTOGRAMS = [request_seconds, stage_seconds, prompt_chars, prompt_tokens, pdf_pages]
+
+# Callables returning {metric name: [(labels, value), ...]}, read at scrape time (e.g. cache stats),
+# with the names among them that are counters; the rest are gauges.
+_collectors: List[Tuple[Callable[[], Dict[str, List[Tuple[dict, float]]]], FrozenSet[str]]] = []
+
+
+def register_collector(
+    collector: Callable[[], Dict[str, List[Tuple[dict, float]]]], counters: Iterable[str] = ()
+) -> None:
+    _collectors.append((collector, frozenset(counters)))
+
+
+@contextmanager
+def span(stage: str):
+    """Time a stage: recorded in the stage histogram and the current request's Server-Timing header."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage=stage)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((stage, elapsed))
+
+
+def record_prompt(provider: str, prompt: str) -> None:
+    prompt_chars.observe(len(prompt), provider=provider)
+    prompt_tokens.observe(len(prompt) / 4, provider=provider)
+
+
+def server_timing(spans: List[Tuple[str, float]]) -> str:
+    totals: Dict[str, float] = {}
+    counts: Counter = Counter()
+    for stage, elapsed in spans:
+        totals[stage] = totals.get(stage, 0.0) + elapsed
+        counts[stage] += 1
+    parts = []
+    for stage, total in totals.items():
+        entry = f"{stage};dur={total * 1000:.1f}"
+        if counts[stage] > 1:
+            entry += f';desc="{counts[stage]} calls"'
+        parts.append(entry)
+    return ", ".join(parts)
+
+
+def render_metrics() -> str:
+    lines: List[str] = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    for collector, counters in _collectors:
+        for name, samples in collector().items():
+            lines.append(f"# TYPE {name} {'counter' if name in counters else 'gauge'}")
+            for labels, value in samples:
+                label_text = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+                lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class StackSampler:
+    """One process-wide sampler of every thread's Python stack, running while any request is in flight.
+
+    Samples are bucketed by time, so a request can collect those taken during
+    its own window. They cover the whole process, not just the request: other
+    requests running at the same time show up too. Samples are folded stacks
+    ("frame;frame;frame count"), the input format of flamegraph.pl and speedscope.
+    """
+
+    BUCKET_SECONDS = 0.1
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._buckets: Deque[Tuple[float, Counter]] = deque()
+        self._windows: Counter = Counter()  # start times of the requests being profiled
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def begin(self) -> float:
+        """Start collecting for a request; pass the returned start time to end()."""
+        start = time.monotonic()
+        with self._lock:
+            self._windows[start] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return start
+
+    def end(self, start: float) -> Counter:
+        """The samples taken since start, dropping any no longer needed by other requests."""
+        samples: Counter = Counter()
+        with self._lock:
+            for bucket_start, bucket in self._buckets:
+                if bucket_start + self.BUCKET_SECONDS >= start:
+                    samples.update(bucket)
+            self._windows[start] -= 1
+            if not self._windows[start]:
+                del self._windows[start]
+            oldest = min(self._windows, default=float("inf"))
+            while self._buckets and self._buckets[0][0] + self.BUCKET_SECONDS < oldest:
+                self._buckets.popleft()
+        return samples
+
+    def _run(self) -> None:
+        own = threading.get_ident()
+        names = {}
+        while True:
+            if not self._windows:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            time.sleep(self.interval)
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                stacks.append(";".join(reversed(stack)))
+            now = time.monotonic()
+            with self._lock:
+                if not self._windows:
+                    continue
+                if not self._buckets or now >= self._buckets[-1][0] + self.BUCKET_SECONDS:
+                    self._buckets.append((now, Counter()))
+                self._buckets[-1][1].update(stacks)
+
+
+stack_sampler = StackSampler(PROFILE_INTERVAL)
+
+
+class MetricsMiddleware:
+    """ASGI middleware: collects stage spans per request, adds a Server-Timing header, records request latency.
+
+    Stages that finish after the response starts (e.g. streamed LLM output)
+    still land in the histograms but can't be in the already-sent header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        spans: List[Tuple[str, float]] = []
+        token = _request_spans.set(spans)
+        start = time.perf_counter()
+        status = {"code": 500}
+        profile_start = stack_sampler.begin() if SLOW_REQUEST_PROFILE_MS else None
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                timing = server_timing(spans + [("total", time.perf_counter() - start)])
+                message = dict(message, headers=list(message.get("headers", [])) + [(b"server-timing", timing.encode())])
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            elapsed = time.perf_counter() - start
+            _request_spans.reset(token)
+            # The router records the matched endpoint in the shared scope; label by its name to keep cardinality low
+            handler = getattr(scope.get("endpoint"), "__name__", "unmatched")
+            request_seconds.observe(elapsed, method=scope["method"], handler=handler, status=str(status["code"]))
+            if profile_start is not None:
+                samples = stack_sampler.end(profile_start)
+                if elapsed * 1000 >= SLOW_REQUEST_PROFILE_MS:
+                    _write_profile(samples, scope["path"], elapsed)
+
+
+def _write_profile(samples: Counter, path: str, elapsed: float) -> None:
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{path.strip('/').replace('/', '_') or 'root'}-{int(elapsed * 1000)}ms.folded"
+    with open(os.path.join(PROFILE_DIR, name), "w") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+    print(f"Slow request {path} took {elapsed * 1000:.0f} ms; stack samples written to {os.path.join(PROFILE_DIR, name)}")
@@ -0,0 +1,259 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+from contextlib import AsyncExitStack
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+import httpx
+from fastapi import HTTPException
+
+from app.limits import ConcurrencyLimiter
+from app.metrics import record_prompt, span
+
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+# How long Ollama keeps a model loaded after its last request.
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Comma-separated models to load at startup, e.g. "llama3,qwen2".
+OLLAMA_WARMUP_MODELS = [m.strip() for m in os.getenv("OLLAMA_WARMUP_MODELS", "").split(",") if m.strip()]
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "16"))
+OLLAMA_MAX_IN_FLIGHT_PER_MODEL = int(os.getenv("OLLAMA_MAX_IN_FLIGHT_PER_MODEL", "2"))
+OLLAMA_MAX_WAITING_PER_MODEL = int(os.getenv("OLLAMA_MAX_WAITING_PER_MODEL", "16"))
+OLLAMA_QUEUE_TIMEOUT = float(os.getenv("OLLAMA_QUEUE_TIMEOUT", "60"))
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "300"))
+# Model names come from requests, so clients are only created for models listed by
+# Ollama's /api/tags (re-read at most every OLLAMA_TAGS_TTL seconds when an unknown
+# name arrives), and at most OLLAMA_MAX_MODELS of them are kept.
+OLLAMA_TAGS_TTL = float(os.getenv("OLLAMA_TAGS_TTL", "10"))
+OLLAMA_MAX_MODELS = int(os.getenv("OLLAMA_MAX_MODELS", "8"))
+
+
+@dataclass
+class OllamaMessage:
+    content: str
+
+
+class OllamaChatClient:
+    """Chat client for one Ollama model, sharing the registry's pooled HTTP connections and per-model limiter.
+
+    ainvoke returns an object with a .content attribute, like the langchain
+    ChatOllama it replaces.
+    """
+
+    def __init__(self, registry: "OllamaRegistry", model: str, temperature: float = 0.7):
+        self.registry = registry
+        self.model = model
+        self.temperature = temperature
+
+    def _payload(self, prompt: str, stream: bool) -> dict:
+        return {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "stream": stream,
+            "keep_alive": OLLAMA_KEEP_ALIVE,
+            "options": {"temperature": self.temperature},
+        }
+
+    async def ainvoke(self, prompt: str) -> OllamaMessage:
+        record_prompt("ollama", prompt)
+        async with self.registry.limiter(self.model).slot():
+            try:
+                with span("ollama"):
+                    response = await self.registry.http().post("/api/chat", json=self._payload(prompt, stream=False))
+                    response.raise_for_status()
+            except httpx.HTTPError as e:
+                raise _ollama_error(self.model, e)
+            return OllamaMessage(response.json().get("message", {}).get("content", ""))
+
+    async def open_stream(self, prompt: str) -> "OllamaStream":
+        """Start a streamed chat and wait for its first message.
+
+        Queueing and Ollama errors are raised here, before any response has been
+        sent, so endpoints can still answer with a real HTTP status.
+        """
+        record_prompt("ollama", prompt)
+        resources = AsyncExitStack()
+        try:
+            await resources.enter_async_context(self.registry.limiter(self.model).slot())
+            resources.enter_context(span("ollama"))
+            try:
+                with span("ollama_first_token"):
+                    response = await resources.enter_async_context(
+                        self.registry.http().stream("POST", "/api/chat", json=self._payload(prompt, stream=True))
+                    )
+                    if response.is_error:
+                        await response.aread()
+                        response.raise_for_status()
+                    lines = response.aiter_lines()
+                    first = await _next_message(lines)
+            except httpx.HTTPError as e:
+                raise _ollama_error(self.model, e)
+        except BaseException:
+            await resources.aclose()
+            raise
+        return OllamaStream(self.model, lines, first, resources)
+
+
+class OllamaStream:
+    """Text of one streamed Ollama chat, holding the model's concurrency slot until closed.
+
+    aclose() is idempotent, so it can be called both by the consumer and as a
+    response background task.
+    """
+
+    def __init__(self, model: str, lines: AsyncIterator[str], first: Optional[dict], resources: AsyncExitStack):
+        self.model = model
+        self._lines = lines
+        self._pending = first
+        self._resources = resources
+        self._closed = False
+
+    def __aiter__(self) -> "OllamaStream":
+        return self
+
+    async def __anext__(self) -> str:
+        if self._pending is not None:
+            data, self._pending = self._pending, None
+        elif self._closed:
+            raise StopAsyncIteration
+        else:
+            try:
+                data = await _next_message(self._lines)
+            except httpx.HTTPError as e:
+                raise _ollama_error(self.model, e)
+        if data is None:
+            await self.aclose()
+            raise StopAsyncIteration
+        if data.get("done"):
+            # The final message may still carry text; the next call ends the stream
+            await self.aclose()
+        return data.get("message", {}).get("content", "")
+
+    async def aclose(self) -> None:
+        if not self._closed:
+            self._closed = True
+            await self._resources.aclose()
+
+
+async def _next_message(lines: AsyncIterator[str]) -> Optional[dict]:
+    """The next message of an NDJSON chat stream, or None at its end."""
+    async for line in lines:
+        if not line:
+            continue
+        data = json.loads(line)
+        if data.get("error"):
+            raise HTTPException(status_code=502, detail=f"Ollama error: {data['error']}")
+        return data
+    return None
+
+
+def _ollama_error(model: str, e: httpx.HTTPError) -> HTTPException:
+    if isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 404:
+        return HTTPException(status_code=400, detail=f"Ollama model '{model}' is not available. Try `ollama pull {model}`.")
+    return HTTPException(status_code=502, detail=f"Ollama request failed: {e}")
+
+
+class OllamaRegistry:
+    """Long-lived Ollama clients keyed by model name over one pooled httpx client."""
+
+    def __init__(self, base_url: str, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.base_url = base_url
+        # Custom transport (e.g. a local stand-in for Ollama in benchmarks); None uses real HTTP
+        self.transport = transport
+        self._http: Optional[httpx.AsyncClient] = None
+        # Limiters live here rather than in the clients, so evicting an idle one never
+        # leaves a request holding a second limiter for the same model
+        self._limiters: "OrderedDict[str, ConcurrencyLimiter]" = OrderedDict()
+        self._warm: Dict[str, bool] = {}
+        self._models: Set[str] = set()
+        self._models_fetched = 0.0
+
+    def http(self) -> httpx.AsyncClient:
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.base_url,
+                transport=self.transport,
+                timeout=httpx.Timeout(OLLAMA_TIMEOUT, connect=5.0),
+                limits=httpx.Limits(
+                    max_connections=OLLAMA_MAX_CONNECTIONS, max_keepalive_connections=OLLAMA_MAX_CONNECTIONS
+                ),
+            )
+        return self._http
+
+    async def get(self, model: str) -> OllamaChatClient:
+        """A client for a model Ollama has installed; 400 for any other name."""
+        if model not in self._limiters and not await self._is_installed(model):
+            raise HTTPException(status_code=400, detail=f"Ollama model '{model}' is not available. Try `ollama pull {model}`.")
+        self.limiter(model)
+        return OllamaChatClient(self, model)
+
+    def limiter(self, model: str) -> ConcurrencyLimiter:
+        limiter = self._limiters.get(model)
+        if limiter is None:
+            self._make_room()
+            limiter = self._limiters[model] = ConcurrencyLimiter(
+                f"Ollama model {model}",
+                OLLAMA_MAX_IN_FLIGHT_PER_MODEL,
+                OLLAMA_MAX_WAITING_PER_MODEL,
+                OLLAMA_QUEUE_TIMEOUT,
+                stage="ollama_queue",
+            )
+        else:
+            self._limiters.move_to_end(model)
+        return limiter
+
+    async def _is_installed(self, model: str) -> bool:
+        if model not in self._models and time.monotonic() - self._models_fetched > OLLAMA_TAGS_TTL:
+            try:
+                response = await self.http().get("/api/tags")
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                raise _ollama_error(model, e)
+            names = {m.get("name", "") for m in response.json().get("models", [])}
+            # "llama3" means "llama3:latest"
+            self._models = names | {name[: -len(":latest")] for name in names if name.endswith(":latest")}
+            self._models_fetched = time.monotonic()
+        return model in self._models
+
+    def _make_room(self) -> None:
+        # Evict the least recently used model with nothing in flight or queued
+        while len(self._limiters) >= OLLAMA_MAX_MODELS:
+            idle = next((m for m, limiter in self._limiters.items() if not limiter.busy), None)
+            if idle is None:
+                raise HTTPException(
+                    status_code=503,
+                    detail=f"Ollama is busy with {len(self._limiters)} models. Please retry shortly.",
+                    headers={"Retry-After": "5"},
+                )
+            del self._limiters[idle]
+
+    async def warm_up(self, models: List[str]) -> None:
+        """Load models into Ollama's memory (an empty generate request) and pin them with keep_alive."""
+
+        async def load(model: str) -> None:
+            try:
+                response = await self.http().post("/api/generate", json={"model": model, "keep_alive": OLLAMA_KEEP_ALIVE})
+                response.raise_for_status()
+                self._warm[model] = True
+                print(f"[Ollama] Warmed up {model}")
+            except httpx.HTTPError as e:
+                self._warm[model] = False
+                print(f"[Ollama] Could not warm up {model}: {e}")
+
+        await asyncio.gather(*(load(model) for model in models))
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    def stats(self) -> dict:
+        return {
+            model: dict(limiter.stats(), warm=self._warm.get(model, False))
+            for model, limiter in sorted(self._limiters.items())
+        }
+
+
+ollama_registry = OllamaRegistry(OLLAMA_BASE_URL)
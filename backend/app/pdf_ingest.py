@@ -0,0 +1,157 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import os
+import tempfile
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+
+from app.cache import TieredCache
+from app.metrics import pdf_pages, span
+
+# Upload handling: the request body is copied in fixed-size chunks to a temp
+# file, which the extraction workers open by path, so the server process never
+# holds a whole PDF in memory.
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(100 * 1024 * 1024)))
+
+# Extraction: pages are split into one contiguous range per worker and parsed
+# in a long-lived process pool so the event loop never runs PdfReader itself.
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Extracted page text is cached by the SHA-256 of the uploaded bytes so repeat
+# uploads of the same paper skip PdfReader entirely.
+PDF_CACHE_MAX_BYTES = int(os.getenv("PDF_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+PDF_CACHE_DB = os.getenv("PDF_CACHE_DB")
+PDF_CACHE_DISK_MAX_BYTES = int(os.getenv("PDF_CACHE_DISK_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))
+
+pdf_text_cache = TieredCache("pdf_text", PDF_CACHE_MAX_BYTES, PDF_CACHE_DB, PDF_CACHE_DISK_MAX_BYTES)
+
+# Called with (pages extracted so far, total pages)
+Progress = Callable[[int, int], None]
+
+_pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+
+
+def get_pdf_pool() -> concurrent.futures.ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = concurrent.futures.ProcessPoolExecutor(max_workers=PDF_WORKERS)
+    return _pool
+
+
+def shutdown_pdf_pool(wait: bool = False) -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=wait, cancel_futures=True)
+        _pool = None
+
+
+@asynccontextmanager
+async def saved_upload(file: UploadFile) -> AsyncIterator[Tuple[str, str]]:
+    """Copy an upload to a temp file in chunks, yielding its path and SHA-256 hex digest.
+
+    The file is deleted when the block exits.
+    """
+    digest = hashlib.sha256()
+    fd, path = tempfile.mkstemp(suffix=".pdf")
+    try:
+        with span("upload"), os.fdopen(fd, "wb") as out:
+            total = 0
+            while True:
+                chunk = await file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                total += len(chunk)
+                if total > MAX_UPLOAD_BYTES:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"PDF exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB upload limit.",
+                    )
+                digest.update(chunk)
+                out.write(chunk)
+        if total == 0:
+            raise HTTPException(status_code=400, detail="Uploaded PDF is empty.")
+        yield path, digest.hexdigest()
+    finally:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass  # moved into the job store
+
+
+# PyPDF2 is imported inside the worker functions: parsing only happens in the
+# pool's processes, so the server process doesn't need to load it at startup.
+def _count_pages(path: str) -> int:
+    from PyPDF2 import PdfReader
+
+    return len(PdfReader(path).pages)
+
+
+def _extract_page_range(path: str, start: int, stop: Optional[int]) -> List[str]:
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(path)
+    if stop is None:
+        stop = len(reader.pages)
+    return [(reader.pages[i].extract_text() or "") for i in range(start, stop)]
+
+
+def _page_ranges(page_count: int) -> List[Tuple[int, int]]:
+    # Every range re-parses the whole document, so use one range per worker and no more.
+    per_task = max(1, -(-page_count // PDF_WORKERS))
+    return [(start, min(start + per_task, page_count)) for start in range(0, page_count, per_task)]
+
+
+async def extract_pages(path: str, progress: Optional[Progress] = None) -> List[str]:
+    """Return the text of every page of the PDF at path in order; index i holds page i + 1.
+
+    progress, if given, is called with (pages extracted, page count) as each page range finishes.
+    """
+    loop = asyncio.get_running_loop()
+    pool = get_pdf_pool()
+    try:
+        if PDF_WORKERS > 1:
+            page_count = await loop.run_in_executor(pool, _count_pages, path)
+            ranges = _page_ranges(page_count)
+        else:
+            # Nothing to parallelize: parse the document once, in a single task
+            page_count, ranges = None, [(0, None)]
+        futures = [loop.run_in_executor(pool, _extract_page_range, path, start, stop) for start, stop in ranges]
+        if progress is not None:
+            extracted = 0
+
+            def report(future: asyncio.Future) -> None:
+                nonlocal extracted
+                if not future.cancelled() and future.exception() is None:
+                    extracted += len(future.result())
+                    progress(extracted, page_count if page_count is not None else extracted)
+
+            for future in futures:
+                future.add_done_callback(report)
+        results = await asyncio.gather(*futures)
+    except Exception as e:
+        # Unpickling a worker's PdfReadError has already imported PyPDF2 here
+        from PyPDF2.errors import PdfReadError
+
+        if isinstance(e, PdfReadError):
+            raise HTTPException(status_code=400, detail=f"Could not read PDF: {e}")
+        raise
+    pages: List[str] = []
+    for chunk in results:
+        pages.extend(chunk)
+    return pages
+
+
+async def load_pages(path: str, doc_hash: str, progress: Optional[Progress] = None) -> List[str]:
+    pages = await pdf_text_cache.aget(doc_hash)
+    if pages is None:
+        with span("extract"):
+            pages = await extract_pages(path, progress)
+        pdf_pages.observe(len(pages))
+        await pdf_text_cache.aset(doc_hash, pages)
+    elif progress is not None:
+        progress(len(pages), len(pages))
+    return pages
@@ -0,0 +1,86 @@
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+# Comma-separated providers to load in the background at startup, e.g. "gemini,duckduckgo".
+# Unset, each provider's SDK is imported on the first request that needs it.
+PRELOAD_PROVIDERS = [p.strip() for p in os.getenv("PRELOAD_PROVIDERS", "").split(",") if p.strip()]
+
+
+class Provider:
+    """A backend SDK client that is imported and initialized once, on first use.
+
+    The factory does the imports and configuration, so apps that never call a
+    provider never pay for its SDK in startup time or memory.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any]):
+        self.name = name
+        self.factory = factory
+        self.load_seconds: Optional[float] = None
+        self._instance: Any = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def get(self) -> Any:
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    start = time.perf_counter()
+                    self._instance = self.factory()
+                    self.load_seconds = time.perf_counter() - start
+                    self._loaded = True
+                    print(f"Loaded {self.name} provider in {self.load_seconds * 1000:.0f} ms")
+        return self._instance
+
+    async def aget(self) -> Any:
+        """Like get(), but runs a first-time load on a worker thread instead of blocking the event loop."""
+        if self._loaded:
+            return self._instance
+        return await asyncio.get_running_loop().run_in_executor(None, self.get)
+
+    def override(self, instance: Any) -> None:
+        """Install a ready-made instance (e.g. a local stand-in in benchmarks) instead of calling the factory."""
+        with self._lock:
+            self._instance = instance
+            self._loaded = True
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self._loaded,
+            "load_ms": round(self.load_seconds * 1000, 1) if self.load_seconds is not None else None,
+        }
+
+
+_providers: Dict[str, Provider] = {}
+
+
+def register(name: str, factory: Callable[[], Any]) -> Provider:
+    provider = _providers[name] = Provider(name, factory)
+    return provider
+
+
+def get_provider(name: str) -> Optional[Provider]:
+    return _providers.get(name)
+
+
+def preload(names: List[str]) -> None:
+    for name in names:
+        provider = get_provider(name)
+        if provider is None:
+            print(f"Unknown provider {name!r} in PRELOAD_PROVIDERS; known: {', '.join(sorted(_providers))}")
+            continue
+        try:
+            provider.get()
+        except Exception as e:
+            print(f"Could not preload {name} provider: {e}")
+
+
+def provider_stats() -> dict:
+    return {name: provider.stats() for name, provider in sorted(_providers.items())}
@@ -0,0 +1,118 @@
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Chunking: windows of CHUNK_WORDS words with CHUNK_OVERLAP words of overlap,
+# never crossing a page boundary so every chunk has one real page number.
+CHUNK_WORDS = int(os.getenv("RETRIEVAL_CHUNK_WORDS", "220"))
+CHUNK_OVERLAP = int(os.getenv("RETRIEVAL_CHUNK_OVERLAP", "40"))
+TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "8"))
+INDEX_CACHE_SIZE = int(os.getenv("RETRIEVAL_INDEX_CACHE_SIZE", "32"))
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or that the this to was were what "
+    "when where which who why will with does do did can about into their there these those than then".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(text.lower()) if t not in _STOPWORDS and len(t) > 1]
+
+
+def chunk_pages(pages: List[str]) -> List[dict]:
+    step = max(1, CHUNK_WORDS - CHUNK_OVERLAP)
+    chunks = []
+    for page_number, text in enumerate(pages, start=1):
+        words = text.split()
+        for start in range(0, max(len(words), 1), step):
+            window = words[start:start + CHUNK_WORDS]
+            if not window:
+                break
+            chunks.append({"page_number": page_number, "text": " ".join(window)})
+            if start + CHUNK_WORDS >= len(words):
+                break
+    return chunks
+
+
+class BM25Index:
+    """Okapi BM25 over page-aware chunks with a postings list per term.
+
+    Each term maps to (chunk ids, term frequencies) arrays, so scoring a query
+    is a handful of vectorized NumPy updates rather than a loop over chunks.
+    """
+
+    def __init__(self, chunks: List[dict]):
+        self.chunks = chunks
+        counts = [Counter(tokenize(chunk["text"])) for chunk in chunks]
+        self.doc_len = np.array([sum(c.values()) for c in counts], dtype=np.float32)
+        avg_len = float(self.doc_len.mean()) if len(chunks) else 0.0
+        self.norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_len / (avg_len or 1.0))
+
+        postings: Dict[str, tuple] = {}
+        for chunk_id, counter in enumerate(counts):
+            for term, tf in counter.items():
+                ids, tfs = postings.setdefault(term, ([], []))
+                ids.append(chunk_id)
+                tfs.append(tf)
+        n = len(chunks)
+        self.postings = {}
+        for term, (ids, tfs) in postings.items():
+            idf = np.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+            self.postings[term] = (np.array(ids, dtype=np.int32), np.array(tfs, dtype=np.float32), idf)
+
+    def search(self, query: str, k: int = TOP_K) -> List[dict]:
+        if not self.chunks:
+            return []
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            ids, tfs, idf = posting
+            scores[ids] += idf * tfs * (BM25_K1 + 1) / (tfs + self.norm[ids])
+        k = min(k, len(self.chunks))
+        if not scores.any():
+            # Nothing in the query matched; fall back to the opening of the document.
+            top = np.arange(k)
+        else:
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            top = top[scores[top] > 0]
+        return [dict(self.chunks[i], chunk_id=int(i), score=float(scores[i])) for i in top]
+
+
+_indexes: "OrderedDict[str, BM25Index]" = OrderedDict()
+_indexes_lock = threading.Lock()
+
+
+def get_index(doc_hash: str, pages: List[str]) -> BM25Index:
+    """Return the BM25 index for a document, building it on first use."""
+    with _indexes_lock:
+        index = _indexes.get(doc_hash)
+        if index is not None:
+            _indexes.move_to_end(doc_hash)
+            return index
+    index = BM25Index(chunk_pages(pages))
+    with _indexes_lock:
+        _indexes[doc_hash] = index
+        while len(_indexes) > INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
+
+
+def format_chunks(chunks: List[dict]) -> str:
+    # Present retrieved passages in reading order so the model sees coherent context.
+    ordered = sorted(chunks, key=lambda c: c["chunk_id"])
+    return "\n\n".join(f"[Page {c['page_number']}]\n{c['text']}" for c in ordered)
+
+
+def retrieve(doc_hash: str, pages: List[str], query: str, k: Optional[int] = None) -> List[dict]:
+    return get_index(doc_hash, pages).search(query, k or TOP_K)
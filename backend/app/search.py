@@ -0,0 +1,152 @@
+import asyncio
+import concurrent.futures
+import json
+import os
+from types import SimpleNamespace
+from typing import List, Optional
+
+from app.cache import SingleFlight, TieredCache, normalize_query
+from app.limits import TokenBucket
+from app.providers import register
+
+# DDGS is blocking network I/O, so searches run on a long-lived thread pool
+# created at startup rather than a fresh process pool per request.
+SEARCH_WORKERS = int(os.getenv("SEARCH_WORKERS", "4"))
+SEARCH_RATE = float(os.getenv("SEARCH_RATE", "1"))  # searches per second, shared across requests
+SEARCH_BURST = int(os.getenv("SEARCH_BURST", "3"))
+SEARCH_RETRIES = int(os.getenv("SEARCH_RETRIES", "2"))
+SEARCH_BACKOFF_BASE = float(os.getenv("SEARCH_BACKOFF_BASE", "5"))
+SEARCH_BACKOFF_MAX = float(os.getenv("SEARCH_BACKOFF_MAX", "60"))
+
+# Results are cached per normalized query + search parameters, and identical
+# searches already in flight are coalesced into a single upstream call.
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", "3600"))
+SEARCH_CACHE_MAX_BYTES = int(os.getenv("SEARCH_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+SEARCH_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36',
+    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.5',
+    'Accept-Encoding': 'gzip, deflate, br',
+    'DNT': '1',
+    'Connection': 'keep-alive',
+    'Upgrade-Insecure-Requests': '1',
+    'Sec-Fetch-Dest': 'document',
+    'Sec-Fetch-Mode': 'navigate',
+    'Sec-Fetch-Site': 'none',
+    'Sec-Fetch-User': '?1',
+    'Cache-Control': 'max-age=0'
+}
+
+search_rate_limiter = TokenBucket(SEARCH_RATE, SEARCH_BURST, SEARCH_BACKOFF_BASE, SEARCH_BACKOFF_MAX)
+search_cache = TieredCache("search", SEARCH_CACHE_MAX_BYTES, ttl=SEARCH_CACHE_TTL)
+_search_flights = SingleFlight()
+
+_executor: Optional[concurrent.futures.ThreadPoolExecutor] = None
+
+
+def _load_duckduckgo() -> SimpleNamespace:
+    from duckduckgo_search import DDGS
+    from duckduckgo_search.exceptions import DuckDuckGoSearchException, RatelimitException
+
+    return SimpleNamespace(DDGS=DDGS, SearchError=DuckDuckGoSearchException, RateLimitError=RatelimitException)
+
+
+# The duckduckgo_search client and its exception types, imported on the first search
+duckduckgo = register("duckduckgo", _load_duckduckgo)
+
+
+def get_search_executor() -> concurrent.futures.ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = concurrent.futures.ThreadPoolExecutor(max_workers=SEARCH_WORKERS, thread_name_prefix="search")
+    return _executor
+
+
+def shutdown_search_executor() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def duckduckgo_search_sync(
+    query: str,
+    max_results: int = 3,
+    region: str = "wt-wt",
+    safesearch: str = "Moderate",
+    backend: str = "lite",
+) -> list:
+    with duckduckgo.get().DDGS() as ddgs:
+        # Set custom headers to appear more like a regular browser
+        ddgs.headers = SEARCH_HEADERS
+        # Defaults to the lite backend, which is less likely to trigger rate limits
+        return [
+            {"title": r.get("title"), "body": r.get("body"), "href": r.get("href")}
+            for r in ddgs.text(
+                query,
+                region=region,
+                safesearch=safesearch,
+                max_results=max_results,
+                backend=backend
+            )
+        ]
+
+
+def _is_rate_limit(e: Exception) -> bool:
+    return isinstance(e, duckduckgo.get().RateLimitError) or "rate limit" in str(e).lower() or "ratelimit" in str(e).lower()
+
+
+async def _search_upstream(query: str, max_results: int, region: str, safesearch: str, backend: str) -> List[dict]:
+    loop = asyncio.get_running_loop()
+    ddg = await duckduckgo.aget()
+    for attempt in range(SEARCH_RETRIES):
+        await search_rate_limiter.acquire()
+        try:
+            results = await loop.run_in_executor(
+                get_search_executor(), duckduckgo_search_sync, query, max_results, region, safesearch, backend
+            )
+        except ddg.SearchError as e:
+            print(f"[DuckDuckGo] Search error: {e}")
+            if not _is_rate_limit(e):
+                return []
+            delay = search_rate_limiter.record_rate_limit()
+            print(f"Rate limit detected, backing off searches for {delay:.1f}s (attempt {attempt + 1}/{SEARCH_RETRIES})")
+            continue
+        except Exception as e:
+            print(f"[DuckDuckGo] Unexpected error: {e}")
+            return []
+        search_rate_limiter.record_success()
+        return results
+    return []
+
+
+async def search_web(
+    query: str,
+    max_results: int = 3,
+    region: str = "wt-wt",
+    safesearch: str = "Moderate",
+    backend: str = "lite",
+) -> List[dict]:
+    """Search DuckDuckGo without blocking the event loop; returns [] on failure.
+
+    Results come from the TTL cache when possible, and concurrent identical
+    searches share one upstream call.
+    """
+    key = json.dumps([normalize_query(query), max_results, region, safesearch, backend])
+    cached = search_cache.get(key)
+    if cached is not None:
+        return cached
+
+    async def run() -> List[dict]:
+        results = await _search_upstream(query, max_results, region, safesearch, backend)
+        # Failures come back empty; don't cache them so the next request retries.
+        if results:
+            search_cache.set(key, results)
+        return results
+
+    return await _search_flights.do(key, run)
+
+
+def search_cache_stats() -> dict:
+    return dict(search_cache.stats(), **_search_flights.stats())
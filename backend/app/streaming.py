@@ -0,0 +1,59 @@
+import json
+from typing import AsyncIterator, Awaitable, Callable, Optional
+
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",  # stop nginx-style proxies from buffering the stream
+}
+
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_response(
+    events: AsyncIterator[str], close: Optional[Callable[[], Awaitable[None]]] = None
+) -> StreamingResponse:
+    # Starlette cancels the generator when the client disconnects, which in turn
+    # cancels the upstream LLM call awaited inside it. close, if given, runs once
+    # the response is over, even if the client left before streaming started.
+    background = BackgroundTask(close) if close is not None else None
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS, background=background)
+
+
+async def stream_tokens(
+    tokens: AsyncIterator[str],
+    sources: list,
+    finish: Callable[[str], Awaitable[dict]],
+) -> AsyncIterator[str]:
+    """Relay LLM tokens as SSE: a sources event, token events, then a done event.
+
+    finish is awaited with the full generated text and returns the payload of
+    the final "done" event (e.g. the parsed summary and process).
+    """
+    yield sse_event("sources", sources)
+    parts = []
+    try:
+        async for token in tokens:
+            if not token:
+                continue
+            parts.append(token)
+            yield sse_event("token", {"text": token})
+        yield sse_event("done", await finish("".join(parts)))
+    except Exception as e:
+        print(f"Error while streaming response: {e}")
+        yield sse_event("error", {"detail": str(e)})
+    finally:
+        close = getattr(tokens, "aclose", None)
+        if close is not None:
+            await close()
+
+
+async def cached_events(response: dict) -> AsyncIterator[str]:
+    """Replay a cached answer as the same sources/done events a live stream ends with."""
+    yield sse_event("sources", response.get("sources", []))
+    yield sse_event("done", {"summary": response.get("summary", ""), "process": response.get("process", "")})
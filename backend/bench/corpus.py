@@ -0,0 +1,70 @@
+"""Deterministic synthetic PDFs of configurable page counts, written without extra dependencies."""
+import os
+import random
+from typing import Dict, List
+
+VOCABULARY = (
+    "attention transformer gradient descent convolution recurrent embedding benchmark dataset accuracy "
+    "precision recall latency throughput regularization dropout optimizer learning rate batch training "
+    "inference quantization distillation retrieval augmentation tokenizer encoder decoder layer neuron "
+    "activation loss function evaluation baseline ablation experiment hypothesis result figure table "
+    "model parameter scaling law compute memory bandwidth kernel cluster distributed parallel pipeline "
+    "knowledge graph reasoning alignment reinforcement reward policy agent environment simulation"
+).split()
+
+LINES_PER_PAGE = 45
+WORDS_PER_LINE = 12
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def page_text(rng: random.Random, page_number: int) -> List[str]:
+    lines = [f"Section {page_number}: results on {rng.choice(VOCABULARY)} and {rng.choice(VOCABULARY)}"]
+    for _ in range(LINES_PER_PAGE - 1):
+        lines.append(" ".join(rng.choice(VOCABULARY) for _ in range(WORDS_PER_LINE)))
+    return lines
+
+
+def make_pdf(page_count: int, seed: int = 0) -> bytes:
+    rng = random.Random(seed * 100003 + page_count)
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        "<< /Type /Pages /Kids [%s] /Count %d >>" % (" ".join(f"{4 + 2 * i} 0 R" for i in range(page_count)), page_count),
+        "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for i in range(page_count):
+        objects.append(
+            "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+        )
+        body = " T* ".join(f"({_escape(line)}) Tj" for line in page_text(rng, i + 1))
+        stream = f"BT /F1 9 Tf 11 TL 40 760 Td {body} ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    return bytes(out)
+
+
+def build_corpus(page_counts: List[int], copies: int = 1, directory: str = "") -> Dict[str, bytes]:
+    """Return {filename: pdf bytes}, `copies` distinct documents per page count; optionally written to directory."""
+    corpus = {}
+    for pages in page_counts:
+        for copy in range(copies):
+            corpus[f"paper_{pages}p_{copy}.pdf"] = make_pdf(pages, seed=copy)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        for name, data in corpus.items():
+            with open(os.path.join(directory, name), "wb") as f:
+                f.write(data)
+    return corpus
@@ -0,0 +1,135 @@
+"""Local stand-ins for Gemini, Ollama and DuckDuckGo with configurable latency.
+
+Each fake sleeps for a "first token" latency and then emits a fixed number of
+tokens spaced by a token interval, so streaming and non-streaming paths can be
+benchmarked without network access.
+"""
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from types import SimpleNamespace
+
+import httpx
+
+
+@dataclass
+class FakeLatency:
+    first_token: float = 0.5
+    tokens: int = 200
+    token_interval: float = 0.005
+
+    def text(self) -> str:
+        return " ".join(f"tok{i}" for i in range(self.tokens))
+
+
+class _FakeGeminiChunk:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _FakeGeminiStream:
+    def __init__(self, latency: FakeLatency):
+        self.latency = latency
+
+    async def __aiter__(self):
+        for i in range(self.latency.tokens):
+            yield _FakeGeminiChunk(f"tok{i} ")
+            await asyncio.sleep(self.latency.token_interval)
+
+
+class FakeGenerativeModel:
+    """Replaces genai.GenerativeModel: same generate_content(_async) surface."""
+
+    def __init__(self, latency: FakeLatency):
+        self.latency = latency
+        self.calls = 0
+        self.prompt_chars = 0
+
+    def generate_content(self, prompt, stream=False):
+        self.calls += 1
+        self.prompt_chars += len(prompt)
+        time.sleep(self.latency.first_token + self.latency.tokens * self.latency.token_interval)
+        return _FakeGeminiChunk(self.latency.text())
+
+    async def generate_content_async(self, prompt, stream=False):
+        self.calls += 1
+        self.prompt_chars += len(prompt)
+        await asyncio.sleep(self.latency.first_token)
+        if stream:
+            return _FakeGeminiStream(self.latency)
+        await asyncio.sleep(self.latency.tokens * self.latency.token_interval)
+        return _FakeGeminiChunk(self.latency.text())
+
+
+def _ollama_answer(latency: FakeLatency) -> str:
+    return (
+        f"Summary:\n{latency.text()}\nKey Findings:\n- finding\nTrends in Industry:\n- trend\n"
+        "Future Trends:\n- future\nProcess:\n1. step\nSources:\n- source"
+    )
+
+
+class FakeOllamaTransport(httpx.AsyncBaseTransport):
+    """httpx transport answering Ollama's /api/chat, /api/generate and /api/tags, streaming NDJSON like the real server."""
+
+    def __init__(self, latency: FakeLatency, models=("llama3:latest",)):
+        self.latency = latency
+        self.models = models
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/api/tags":
+            return httpx.Response(200, json={"models": [{"name": name} for name in self.models]})
+        body = json.loads(request.content or b"{}")
+        if request.url.path == "/api/generate":
+            return httpx.Response(200, json={"model": body.get("model"), "done": True})
+        await asyncio.sleep(self.latency.first_token)
+        answer = _ollama_answer(self.latency)
+        if not body.get("stream"):
+            await asyncio.sleep(self.latency.tokens * self.latency.token_interval)
+            return httpx.Response(200, json={"message": {"role": "assistant", "content": answer}, "done": True})
+
+        latency = self.latency
+
+        async def lines():
+            words = answer.split(" ")
+            for word in words:
+                yield (json.dumps({"message": {"role": "assistant", "content": word + " "}, "done": False}) + "\n").encode()
+                await asyncio.sleep(latency.token_interval)
+            yield (json.dumps({"message": {"role": "assistant", "content": ""}, "done": True}) + "\n").encode()
+
+        return httpx.Response(200, content=lines())
+
+
+def make_fake_ddgs(latency: float):
+    """Build a DDGS replacement whose text() blocks for `latency` seconds like a real search."""
+
+    class FakeDDGS:
+        headers: dict = {}
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def text(self, query, region="wt-wt", safesearch="Moderate", max_results=3, backend="lite"):
+            time.sleep(latency)
+            return [
+                {"title": f"Result {i} for {query}", "body": f"Snippet {i} about {query}. " * 5, "href": f"https://example.com/{i}"}
+                for i in range(max_results)
+            ]
+
+    return FakeDDGS
+
+
+class FakeSearchError(Exception):
+    pass
+
+
+class FakeRateLimitError(FakeSearchError):
+    pass
+
+
+def make_fake_duckduckgo(latency: float) -> SimpleNamespace:
+    """Stand-in for the lazily loaded duckduckgo_search provider (client class plus its exception types)."""
+    return SimpleNamespace(DDGS=make_fake_ddgs(latency), SearchError=FakeSearchError, RateLimitError=FakeRateLimitError)
@@ -0,0 +1,120 @@
+"""Closed-loop load generator: N concurrent workers issue requests until the total is reached."""
+import asyncio
+import itertools
+import math
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List
+
+import httpx
+
+QUERIES = [
+    "How does attention compare to convolution for throughput?",
+    "What do the results say about quantization and latency?",
+    "Summarize the evidence on scaling law and compute.",
+    "Which regularization methods improve accuracy?",
+    "What are the findings on retrieval augmentation?",
+]
+
+
+@dataclass
+class Sample:
+    ok: bool
+    latency: float
+    ttfb: float
+
+
+@dataclass
+class ScenarioResult:
+    scenario: str
+    concurrency: int
+    wall_time: float
+    samples: List[Sample] = field(default_factory=list)
+    errors: Dict[str, int] = field(default_factory=dict)
+
+    def summary(self) -> dict:
+        ok = [s for s in self.samples if s.ok]
+        latencies = sorted(s.latency for s in ok)
+        ttfbs = sorted(s.ttfb for s in ok)
+        return {
+            "scenario": self.scenario,
+            "concurrency": self.concurrency,
+            "requests": len(self.samples),
+            "errors": len(self.samples) - len(ok),
+            "throughput_rps": round(len(ok) / self.wall_time, 2) if self.wall_time else 0.0,
+            "p50_ms": percentile_ms(latencies, 50),
+            "p95_ms": percentile_ms(latencies, 95),
+            "p99_ms": percentile_ms(latencies, 99),
+            "ttfb_p50_ms": percentile_ms(ttfbs, 50),
+            "ttfb_p95_ms": percentile_ms(ttfbs, 95),
+            "error_kinds": dict(self.errors),
+        }
+
+
+def percentile_ms(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    rank = max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)
+    return round(sorted_values[rank] * 1000, 1)
+
+
+def research_request(path: str, corpus: Dict[str, bytes]) -> Callable[[int], dict]:
+    documents = list(corpus.items())
+
+    def build(i: int) -> dict:
+        name, data = documents[i % len(documents)]
+        return {
+            "method": "POST",
+            "url": path,
+            "data": {"query": QUERIES[i % len(QUERIES)]},
+            "files": {"file": (name, data, "application/pdf")},
+        }
+
+    return build
+
+
+def websearch_request(path: str) -> Callable[[int], dict]:
+    def build(i: int) -> dict:
+        return {"method": "POST", "url": path, "json": {"query": f"{QUERIES[i % len(QUERIES)]} #{i}", "model": "llama3"}}
+
+    return build
+
+
+async def _timed_request(client: httpx.AsyncClient, request: dict) -> Sample:
+    start = time.perf_counter()
+    ttfb = None
+    async with client.stream(**request) as response:
+        async for _ in response.aiter_raw():
+            if ttfb is None:
+                ttfb = time.perf_counter() - start
+        latency = time.perf_counter() - start
+        if response.is_error:
+            raise httpx.HTTPStatusError(f"HTTP {response.status_code}", request=response.request, response=response)
+    return Sample(True, latency, ttfb if ttfb is not None else latency)
+
+
+async def run_scenario(
+    base_url: str, scenario: str, build: Callable[[int], dict], concurrency: int, total: int, timeout: float = 600
+) -> ScenarioResult:
+    result = ScenarioResult(scenario, concurrency, 0.0)
+    counter = itertools.count()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        async def worker():
+            while True:
+                i = next(counter)
+                if i >= total:
+                    return
+                start = time.perf_counter()
+                try:
+                    result.samples.append(await _timed_request(client, build(i)))
+                except Exception as e:
+                    kind = f"HTTP {e.response.status_code}" if isinstance(e, httpx.HTTPStatusError) else type(e).__name__
+                    result.errors[kind] = result.errors.get(kind, 0) + 1
+                    result.samples.append(Sample(False, time.perf_counter() - start, 0.0))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        result.wall_time = time.perf_counter() - started
+    return result
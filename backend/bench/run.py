@@ -0,0 +1,146 @@
+"""Offline load test and benchmark for the research backend.
+
+Starts the backend with fake Gemini/Ollama/DuckDuckGo providers in a
+subprocess (one per scenario, so peak RSS is per scenario), drives it at each
+concurrency level, and prints throughput, latency percentiles, time to first
+byte and peak RSS. Run from backend/:
+
+    python -m bench.run --concurrency 1,8,32 --requests 64
+    python -m bench.run --scenarios research --pages 10,200,500 --json report.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench.corpus import build_corpus
+from bench.loadgen import research_request, run_scenario, websearch_request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    "research": lambda corpus: research_request("/api/research", corpus),
+    "research-stream": lambda corpus: research_request("/api/research/stream", corpus),
+    "websearch": lambda corpus: websearch_request("/api/websearch"),
+    "websearch-stream": lambda corpus: websearch_request("/api/websearch/stream"),
+}
+
+COLUMNS = [
+    ("scenario", "scenario", 17), ("concurrency", "conc", 5), ("requests", "reqs", 5), ("errors", "errs", 5),
+    ("throughput_rps", "req/s", 8), ("p50_ms", "p50 ms", 9), ("p95_ms", "p95 ms", 9), ("p99_ms", "p99 ms", 9),
+    ("ttfb_p50_ms", "ttfb50", 9), ("ttfb_p95_ms", "ttfb95", 9), ("peak_rss_mb", "rss MB", 7),
+]
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _int_list(value: str):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+class BenchServer:
+    def __init__(self, args):
+        self.port = _free_port()
+        self.stats_file = tempfile.NamedTemporaryFile(suffix=".json", delete=False).name
+        command = [
+            sys.executable, "-m", "bench.server", "--port", str(self.port),
+            "--first-token", str(args.first_token), "--tokens", str(args.tokens),
+            "--token-interval", str(args.token_interval), "--search-latency", str(args.search_latency),
+            "--stats-file", self.stats_file,
+        ]
+        if args.caches:
+            command.append("--caches")
+        self.process = subprocess.Popen(command, cwd=BACKEND_DIR)
+        self.base_url = f"http://127.0.0.1:{self.port}"
+
+    def wait_ready(self, timeout: float = 60) -> None:
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError("benchmark server exited during startup")
+            try:
+                httpx.get(f"{self.base_url}/api/cache/stats", timeout=1)
+                return
+            except httpx.HTTPError:
+                time.sleep(0.1)
+        raise RuntimeError("benchmark server did not start in time")
+
+    def stop(self) -> dict:
+        self.process.send_signal(signal.SIGINT)
+        try:
+            self.process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+        try:
+            with open(self.stats_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+        finally:
+            os.unlink(self.stats_file)
+
+
+def print_table(rows) -> None:
+    print(" ".join(title.rjust(width) for _, title, width in COLUMNS))
+    for row in rows:
+        print(" ".join(str(row.get(key, "")).rjust(width) for key, _, width in COLUMNS))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=64, help="requests per scenario and concurrency level")
+    parser.add_argument("--pages", default="10,50,200", help="page counts of the generated PDF corpus")
+    parser.add_argument("--copies", type=int, default=2, help="distinct PDFs per page count")
+    parser.add_argument("--first-token", type=float, default=0.5)
+    parser.add_argument("--tokens", type=int, default=200)
+    parser.add_argument("--token-interval", type=float, default=0.005)
+    parser.add_argument("--search-latency", type=float, default=0.3)
+    parser.add_argument("--caches", action="store_true", help="benchmark with the answer, search, PDF text and BM25 index caches enabled")
+    parser.add_argument("--json", default="", help="also write the report to this file")
+    args = parser.parse_args()
+
+    corpus = build_corpus(_int_list(args.pages), args.copies)
+    rows = []
+    for scenario in [s.strip() for s in args.scenarios.split(",") if s.strip()]:
+        if scenario not in SCENARIOS:
+            parser.error(f"unknown scenario {scenario!r}")
+        server = BenchServer(args)
+        try:
+            server.wait_ready()
+            results = [
+                asyncio.run(run_scenario(server.base_url, scenario, SCENARIOS[scenario](corpus), concurrency, args.requests))
+                for concurrency in _int_list(args.concurrency)
+            ]
+        finally:
+            rss = server.stop()
+        for result in results:
+            row = result.summary()
+            row["peak_rss_mb"] = rss.get("server_mb", "")
+            row["peak_worker_rss_mb"] = rss.get("largest_worker_mb", "")
+            rows.append(row)
+
+    print_table(rows)
+    for row in rows:
+        if row["error_kinds"]:
+            print(f"{row['scenario']} @ {row['concurrency']}: errors {row['error_kinds']}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), "results": rows}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
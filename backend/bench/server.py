@@ -0,0 +1,72 @@
+"""Run the backend with fake providers installed, for benchmarking: python -m bench.server --port 8765"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+
+
+def peak_rss_mb() -> dict:
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return {"server_mb": round(own, 1), "largest_worker_mb": round(children, 1)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--first-token", type=float, default=0.5, help="seconds before the first LLM token")
+    parser.add_argument("--tokens", type=int, default=200, help="tokens per LLM answer")
+    parser.add_argument("--token-interval", type=float, default=0.005, help="seconds between LLM tokens")
+    parser.add_argument("--search-latency", type=float, default=0.3, help="seconds per fake DuckDuckGo search")
+    parser.add_argument("--caches", action="store_true", help="keep the answer, search, PDF text and BM25 index caches enabled")
+    parser.add_argument("--stats-file", default="", help="write peak RSS here on shutdown")
+    args = parser.parse_args()
+
+    # Settings are read at import time, so they must be in place before importing the app.
+    # Explicit environment variables still win, so production limits can be benchmarked too.
+    if not args.caches:
+        os.environ.setdefault("ANSWER_CACHE_MAX_BYTES", "0")
+        os.environ.setdefault("SEARCH_CACHE_MAX_BYTES", "0")
+        os.environ.setdefault("PDF_CACHE_MAX_BYTES", "0")
+        os.environ.setdefault("RETRIEVAL_INDEX_CACHE_SIZE", "0")
+        # An empty path turns off the SQLite tiers even if .env configures them
+        os.environ.setdefault("ANSWER_CACHE_DB", "")
+        os.environ.setdefault("PDF_CACHE_DB", "")
+    os.environ.setdefault("SEARCH_RATE", "1000")
+    os.environ.setdefault("SEARCH_BURST", "1000")
+    os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+    # Don't resume (or pollute) the jobs of a local development database
+    os.environ.setdefault("JOB_DIR", tempfile.mkdtemp(prefix="bench-jobs-"))
+
+    import uvicorn
+
+    from bench import fakes
+    import app.gemini
+    import app.main
+    import app.ollama
+    import app.pdf_ingest
+    import app.search
+
+    latency = fakes.FakeLatency(args.first_token, args.tokens, args.token_interval)
+    app.gemini.gemini_model.override(fakes.FakeGenerativeModel(latency))
+    app.ollama.ollama_registry.transport = fakes.FakeOllamaTransport(latency)
+    app.search.duckduckgo.override(fakes.make_fake_duckduckgo(args.search_latency))
+
+    if args.stats_file:
+        def write_stats():
+            # Reap the extraction workers first so their peak RSS is included
+            app.pdf_ingest.shutdown_pdf_pool(wait=True)
+            with open(args.stats_file, "w") as f:
+                json.dump(peak_rss_mb(), f)
+
+        app.main.app.router.on_shutdown.insert(0, write_stats)
+
+    uvicorn.run(app.main.app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Cold-start benchmark: time and memory for the backend to import and to serve its first request.
+
+Every run uses a fresh interpreter, so nothing warm is shared between runs.
+"import" is the time to import app.main; "ready" is the time from launching
+uvicorn until the first HTTP response. --providers also times the first-use
+load of the named providers (e.g. gemini, duckduckgo). Run from backend/:
+
+    python -m bench.startup --runs 5
+    python -m bench.startup --providers gemini,duckduckgo --json startup.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench.run import BACKEND_DIR, _free_port
+
+IMPORT_PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import app.main
+from app.providers import get_provider
+result = {"import_ms": (time.perf_counter() - start) * 1000, "modules": len(sys.modules)}
+for name in sys.argv[1:]:
+    start = time.perf_counter()
+    get_provider(name).get()
+    result[name + "_load_ms"] = (time.perf_counter() - start) * 1000
+scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+print(json.dumps(result))
+"""
+
+
+def _env() -> dict:
+    env = dict(os.environ)
+    env.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+    env.setdefault("JOB_DIR", os.path.join(tempfile.gettempdir(), "bench-startup-jobs"))
+    return env
+
+
+def measure_import(providers) -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE, *providers],
+        cwd=BACKEND_DIR, env=_env(), check=True, capture_output=True, text=True,
+    ).stdout
+    # Providers print a line when they load; the probe's JSON is always last
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _rss_mb(pid: int) -> float:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def measure_ready(timeout: float = 60) -> dict:
+    port = _free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=_env(),
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError("backend exited during startup")
+            try:
+                httpx.get(f"http://127.0.0.1:{port}/api/cache/stats", timeout=1)
+                return {"ready_ms": (time.perf_counter() - start) * 1000, "ready_rss_mb": _rss_mb(process.pid)}
+            except httpx.HTTPError:
+                time.sleep(0.02)
+        raise RuntimeError("backend did not start in time")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--providers", default="", help="comma-separated providers to load after import")
+    parser.add_argument("--json", default="", help="also write the report to this file")
+    args = parser.parse_args()
+    providers = [p.strip() for p in args.providers.split(",") if p.strip()]
+
+    runs = []
+    for _ in range(args.runs):
+        run = measure_import(providers)
+        run.update(measure_ready())
+        runs.append(run)
+
+    report = {}
+    print(f"{'metric':>22} {'median':>9} {'min':>9} {'max':>9}")
+    for key in runs[0]:
+        values = [run[key] for run in runs]
+        report[key] = {"median": round(statistics.median(values), 1), "min": round(min(values), 1), "max": round(max(values), 1)}
+        print(f"{key:>22} " + " ".join(f"{report[key][stat]:>9}" for stat in ("median", "min", "max")))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), "runs": runs, "summary": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
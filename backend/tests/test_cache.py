@@ -0,0 +1,67 @@
+import asyncio
+
+from app import cache
+from app.cache import SingleFlight, TieredCache
+
+
+def test_memory_tier_evicts_least_recently_used():
+    tiered = TieredCache("test", max_bytes=20)
+    tiered.set("a", "x" * 5)
+    tiered.set("b", "y" * 5)
+    tiered.get("a")
+    tiered.set("c", "z" * 5)
+
+    assert tiered.get("a") == "x" * 5
+    assert tiered.get("b") is None
+    assert tiered.stats()["evictions"] == 1
+
+
+def test_entries_expire_after_ttl(monkeypatch, tmp_path):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    tiered = TieredCache("test", 1024, str(tmp_path / "cache.db"), 1024, ttl=10)
+    tiered.set("k", {"v": 1})
+
+    now[0] += 5
+    assert tiered.get("k") == {"v": 1}
+    now[0] += 10
+    assert tiered.get("k") is None
+    stats = tiered.stats()
+    assert stats["expired"] == 1
+    assert stats["disk_entries"] == 0
+
+
+def test_disk_tier_survives_restart_and_respects_its_limit(tmp_path):
+    path = str(tmp_path / "cache.db")
+    first = TieredCache("test", 1024, path, max_disk_bytes=30)
+    first.set("a", "x" * 10)
+    first.set("b", "y" * 10)
+    first.set("c", "z" * 10)
+
+    second = TieredCache("test", 1024, path, max_disk_bytes=30)
+
+    assert second.get("a") is None
+    assert second.get("c") == "z" * 10
+    assert second.stats()["disk_hits"] == 1
+    assert second.stats()["disk_bytes"] <= 30
+
+
+def test_single_flight_coalesces_concurrent_calls():
+    calls = 0
+
+    async def fetch():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def run():
+        flight = SingleFlight()
+        results = await asyncio.gather(*(flight.do("key", fetch) for _ in range(5)))
+        return results, flight.stats()
+
+    results, stats = asyncio.run(run())
+
+    assert results == ["result"] * 5
+    assert calls == 1
+    assert stats == {"in_flight": 0, "coalesced": 4}
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+from fastapi import HTTPException
+
+from app.jobs import JobStore
+
+
+def upload(tmp_path, name: str) -> str:
+    path = tmp_path / name
+    path.write_bytes(b"%PDF-1.4 test")
+    return str(path)
+
+
+def test_submit_deduplicates_without_taking_the_upload(tmp_path):
+    store = JobStore(str(tmp_path / "jobs"))
+    first_upload = upload(tmp_path, "first.pdf")
+    job, created = store.submit("key", "query", "first.pdf", "hash", first_upload, max_queued=10)
+
+    second_upload = upload(tmp_path, "second.pdf")
+    again, created_again = store.submit("key", "query", "second.pdf", "hash", second_upload, max_queued=10)
+
+    assert created and not created_again
+    assert again["id"] == job["id"]
+    assert not os.path.exists(first_upload)
+    assert os.path.exists(store.document_path(job["id"]))
+    assert os.path.exists(second_upload)
+
+
+def test_submit_rejects_when_too_many_jobs_are_queued(tmp_path):
+    store = JobStore(str(tmp_path / "jobs"))
+    first, _ = store.submit("one", "query", "a.pdf", "hash", upload(tmp_path, "a.pdf"), max_queued=1)
+
+    with pytest.raises(HTTPException) as rejected:
+        store.submit("two", "query", "b.pdf", "hash", upload(tmp_path, "b.pdf"), max_queued=1)
+
+    assert rejected.value.status_code == 503
+    assert os.listdir(tmp_path / "jobs" / "documents") == [f"{first['id']}.pdf"]
+
+
+def test_recover_requeues_interrupted_jobs_and_drops_finished_documents(tmp_path):
+    directory = str(tmp_path / "jobs")
+    store = JobStore(directory)
+    running, _ = store.submit("a", "query", "a.pdf", "hash-a", upload(tmp_path, "a.pdf"), max_queued=10)
+    finished, _ = store.submit("b", "query", "b.pdf", "hash-b", upload(tmp_path, "b.pdf"), max_queued=10)
+    queued, _ = store.submit("c", "query", "c.pdf", "hash-c", upload(tmp_path, "c.pdf"), max_queued=10)
+    assert store.claim(running["id"])
+    store.update(running["id"], stage="summarize", pages_extracted=3)
+    store.finish(finished["id"], result={"summary": "done"})
+    # A document left behind, e.g. by a crash between moving it in and inserting its job
+    open(os.path.join(directory, "documents", "orphan.pdf"), "wb").close()
+
+    restarted = JobStore(directory)
+    queue = restarted.recover(retention=3600)
+
+    assert queue == [running["id"], queued["id"]]
+    job = restarted.get(running["id"])
+    assert (job["status"], job["stage"], job["pages_extracted"]) == ("queued", "queued", 0)
+    assert restarted.get(finished["id"])["result"] == {"summary": "done"}
+    assert sorted(os.listdir(os.path.join(directory, "documents"))) == sorted(
+        f"{job_id}.pdf" for job_id in queue
+    )
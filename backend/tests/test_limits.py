@@ -0,0 +1,65 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.limits import ConcurrencyLimiter
+
+
+def test_limiter_rejects_when_queue_is_full():
+    async def run():
+        limiter = ConcurrencyLimiter("Test", max_in_flight=1, max_waiting=1, wait_timeout=5)
+        release = asyncio.Event()
+
+        async def hold():
+            async with limiter.slot():
+                await release.wait()
+
+        holders = [asyncio.create_task(hold()) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as rejected:
+            async with limiter.slot():
+                pass
+        release.set()
+        await asyncio.gather(*holders)
+        return rejected.value, limiter.stats()
+
+    error, stats = asyncio.run(run())
+
+    assert error.status_code == 503
+    assert "Retry-After" in error.headers
+    assert (stats["in_flight"], stats["waiting"], stats["rejected"]) == (0, 0, 1)
+
+
+def test_limiter_rejects_after_wait_timeout():
+    async def run():
+        limiter = ConcurrencyLimiter("Test", max_in_flight=1, max_waiting=5, wait_timeout=0.01)
+        async with limiter.slot():
+            with pytest.raises(HTTPException) as rejected:
+                async with limiter.slot():
+                    pass
+        return rejected.value
+
+    assert asyncio.run(run()).status_code == 503
+
+
+def test_background_callers_wait_instead_of_being_rejected():
+    async def run():
+        limiter = ConcurrencyLimiter("Test", max_in_flight=1, max_waiting=0, wait_timeout=0.01)
+        order = []
+
+        async def background():
+            async with limiter.slot(background=True):
+                order.append("background")
+
+        async with limiter.slot():
+            task = asyncio.create_task(background())
+            await asyncio.sleep(0.05)
+            order.append("interactive")
+        await task
+        return order, limiter.stats()
+
+    order, stats = asyncio.run(run())
+
+    assert order == ["interactive", "background"]
+    assert stats["rejected"] == 0
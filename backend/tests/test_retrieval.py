@@ -0,0 +1,38 @@
+from app import retrieval
+from app.retrieval import BM25Index, chunk_pages
+
+
+def test_chunk_pages_stays_within_pages_and_overlaps(monkeypatch):
+    monkeypatch.setattr(retrieval, "CHUNK_WORDS", 4)
+    monkeypatch.setattr(retrieval, "CHUNK_OVERLAP", 1)
+    pages = [" ".join(f"a{i}" for i in range(7)), "b0 b1", ""]
+
+    chunks = chunk_pages(pages)
+
+    assert [(c["page_number"], c["text"]) for c in chunks] == [
+        (1, "a0 a1 a2 a3"),
+        (1, "a3 a4 a5 a6"),
+        (2, "b0 b1"),
+    ]
+
+
+def test_bm25_ranks_matching_chunks_first():
+    index = BM25Index([
+        {"page_number": 1, "text": "training data pipelines for language models"},
+        {"page_number": 2, "text": "attention heads attention layers and attention scores"},
+        {"page_number": 3, "text": "evaluation benchmarks"},
+    ])
+
+    results = index.search("attention layers", k=3)
+
+    assert [r["page_number"] for r in results] == [2]
+    assert results[0]["score"] > 0
+
+
+def test_bm25_falls_back_to_document_opening_when_nothing_matches():
+    index = BM25Index([{"page_number": n, "text": f"page {n} content"} for n in range(1, 6)])
+
+    results = index.search("quantum chromodynamics", k=2)
+
+    assert [r["page_number"] for r in results] == [1, 2]
+    assert all(r["score"] == 0 for r in results)